@@ -1,20 +1,30 @@
 import chess
 import random
 
-def random_policy():
+def random_policy(seed=None):
+    # own RNG, so a game replays the same whatever else runs in the process
+    rng = random.Random(seed)
     def policy(pos):
         actions = pos.get_actions()
-        return random.choice(actions)
+        return rng.choice(actions)
     return policy
 
-def greedy_policy(defender_eval):
+def greedy_policy(defender_eval, batch=None):
+    # batch -- optional function returning (moves, values) for all the moves of a
+    # position at once, the values defender_eval would give
     def policy(pos):
         best_value = float('-inf')
         best_move = None
-        moves = pos.get_actions()
-        for move in moves:
-            child = pos.successor(move)
-            value = defender_eval(child)
+        if batch is not None:
+            moves, values = batch(pos)
+        else:
+            moves = pos.get_actions()
+            values = []
+            for move in moves:
+                pos.apply(move)
+                values.append(defender_eval(pos))
+                pos.undo()
+        for move, value in zip(moves, values):
             if value > best_value:
                 best_value = value
                 best_move = move
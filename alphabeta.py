@@ -1,43 +1,436 @@
-def alphabeta_policy(depth, h):
+import functools
+import math
+import threading
+import time
+
+from ordering import white_move_effects
+from symmetry import canonical_position_key, transform_move
+from transposition import EXACT, LOWER, UPPER, TranspositionTable, position_key
+
+MAX_DEPTH = 64
+
+# a checkmate ply plies from the root scores MATE - ply, so the search prefers the
+# shortest mate; anything above MATE_BOUND is a mate score
+MATE = 1000.0
+MATE_BOUND = MATE - 2 * MAX_DEPTH
+
+# moves White is assumed to still need when splitting a game clock
+MOVES_TO_GO = 30
+
+
+class SearchTimeout(Exception):
+    ''' Raised inside alphabeta when the deadline of a timed search passes.
+    '''
+    pass
+
+
+class StopSignal:
+    ''' A deadline for alphabeta that passes when stop is called instead of at a
+        time: time.perf_counter() > signal is false until then.
+    '''
+    def __init__(self):
+        self.stopped = False
+
+
+    def stop(self):
+        self.stopped = True
+
+
+    def __lt__(self, now):
+        return self.stopped
+
+
+class Ponder:
+    ''' A search run in a background thread on the position a policy expects to
+        move in next, while the opponent thinks.  Counts ponders and hits.
+    '''
+    def __init__(self):
+        self.thread = None
+        self.signal = None
+        # the searched position as it was before the search started moving in it
+        self.key = None
+        self.history = None
+        self.result = None
+        self.ponders = 0
+        self.hits = 0
+
+
+    def start(self, root, search):
+        ''' Starts search(root, deadline) in the background; it may raise SearchTimeout.
+
+            root -- the position to search, which nothing else may touch meanwhile
+            search -- a function of a position and a deadline returning (value, move)
+        '''
+        self.finish(None)
+        self.signal = StopSignal()
+        self.key = root.key
+        self.history = dict(root.history)
+        self.result = None
+        self.ponders += 1
+
+        def run():
+            try:
+                self.result = search(root, self.signal)
+            except SearchTimeout:
+                pass
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+
+    def finish(self, pos):
+        ''' Returns the (value, move) of the search if it was of pos (a ponder hit),
+            waiting for it to complete, and otherwise stops it and returns None.
+
+            pos -- the position the policy has to move in, or None to just stop
+        '''
+        if self.thread is None:
+            return None
+        hit = pos is not None and pos.key == self.key and pos.history == self.history
+        if not hit:
+            self.signal.stop()
+        self.thread.join()
+        self.thread = self.history = None
+        if hit and self.result is not None:
+            self.hits += 1
+            return self.result
+        return None
+
+
+    def stats(self):
+        return {"ponders": self.ponders, "hits": self.hits}
+
+
+def alphabeta_policy(depth, h, tt=None, ordering=None, movetime=None, game_time=None, threads=1,
+                     search=None, window=None, pruning=None, stats=None):
+    ''' Returns a policy that searches to the given depth, or, when movetime (seconds
+        per move) or game_time (seconds for all of this side's moves in a game) is
+        given, deepens iteratively up to depth until its time for the move runs out.
+        With threads > 1, fixed-depth searches without pruning or statistics split the
+        root moves among that many worker processes (see parallel_search.py).
+
+        The policy keeps its table, ordering and the principal variation of its last
+        search between moves: when the opponent answers as that line expects, the
+        rest of it orders the next search.  Fixed-depth serial policies can also
+        ponder: fxn.ponder(pos), given the position after the policy's move, searches
+        the position after the expected reply in a background thread, and the next
+        call uses that result if the reply was played.  fxn.stop_pondering() stops it.
+
+        search -- a function with alphabeta's arguments to search with (alphabeta if None)
+        window -- half-width of the aspiration window iterative deepening puts
+                  around the previous iteration's value, or None for full windows
+        pruning -- a Pruning to search alphabeta with, or None
+        stats -- a search_stats.SearchStats for the policy's own searches (not
+                 pondering) to count in, or None
+    '''
+    if search is None:
+        search = alphabeta
+    if pruning is not None:
+        search = functools.partial(search, pruning=pruning)
+    # pondering runs while the opponent moves, outside any move's statistics
+    ponder_with = search
+    if stats is not None:
+        search = functools.partial(search, stats=stats)
+    timed = movetime is not None or game_time is not None
+    if timed and tt is None:
+        # the table carries the previous iteration's PV
+        tt = TranspositionTable(1)
+    clock = {"remaining": game_time}
+    parallel = not timed and threads > 1 and pruning is None and stats is None
+    if parallel:
+        from parallel_search import new_session, parallel_alphabeta
+        session = new_session()
+    # the last search's PV, and the key of the position it expects to move in next
+    line = {"pv": [], "key": None}
+    ponder_search = Ponder()
+
     def fxn(pos):
-        value, move = alphabeta(pos, depth, h, -h.inf, h.inf)
+        result = ponder_search.finish(pos)
+        pv = line["pv"][2:] if pos.key == line["key"] else None
+        if result is None and ordering is not None:
+            ordering.new_search()
+
+        if result is not None:
+            value, move = result
+        elif parallel:
+            value, move = parallel_alphabeta(pos, depth, h, threads, tt, ordering, session, pv)
+        elif not timed:
+            value, move = search(pos, depth, h, -h.inf, h.inf, tt, ordering=ordering, pv=pv)
+        else:
+            if game_time is not None and len(pos.history) == 1:
+                # first move of a new game (no position seen before this one)
+                clock["remaining"] = game_time
+            budget = movetime
+            if game_time is not None:
+                share = max(clock["remaining"], 0.0) / MOVES_TO_GO
+                budget = share if budget is None else min(budget, share)
+
+            start = time.perf_counter()
+            value, move = iterative_deepening(pos, depth or MAX_DEPTH, h, start + budget, tt, ordering,
+                                              search, window)
+            if game_time is not None:
+                clock["remaining"] -= time.perf_counter() - start
+
         if move is None:
             moves = pos.get_actions()
             if not moves:
                 return None
             move = moves[0]
+        remember_line(pos, move)
         return move
+
+    def remember_line(pos, move):
+        pv = principal_variation(pos, tt, depth or MAX_DEPTH) if tt is not None else []
+        if not pv or pv[0] != move:
+            pv = [move]
+        line["pv"] = pv
+        line["key"] = None
+        if len(pv) >= 2:
+            pos.apply(pv[0])
+            pos.apply(pv[1])
+            line["key"] = pos.key
+            pos.undo()
+            pos.undo()
+
+    def ponder(pos):
+        pv = line["pv"]
+        if timed or parallel or len(pv) < 2 or pos.is_terminal() or pv[1] not in pos.get_actions():
+            return
+        root = pos.successor(pv[1])
+        if root.is_terminal():
+            return
+
+        def run(root, deadline):
+            if ordering is not None:
+                ordering.new_search()
+            return ponder_with(root, depth, h, -h.inf, h.inf, tt, ordering=ordering, deadline=deadline, pv=pv[2:])
+        ponder_search.start(root, run)
+
+    fxn.h = h
+    fxn.tt = tt
+    fxn.ordering = ordering
+    fxn.pruning = pruning
+    fxn.ponder = ponder
+    fxn.stop_pondering = lambda: ponder_search.finish(None)
+    fxn.ponder_search = ponder_search
     return fxn
 
-def alphabeta(pos, depth, h, alpha, beta):
-    # if d>0 and s is not terminal, returns
-    # 1) m = minimax(s, d, h) if 𝜶 ≤ 𝒎 ≤ 𝜷
-    # 2) upper bound a s.t. 𝒎 ≤ 𝒂 ≤ 𝜶 if 𝒎 < 𝜶
-    # 3) lower bound b s.t. 𝜷 ≤ 𝒃 ≤ 𝒎 if 𝒎 > 𝜷
 
-    # if s is terminal then return value determined by rules
-    # if d == 0 then return h(s)
+def iterative_deepening(pos, max_depth, h, deadline, tt, ordering=None, search=None, window=None):
+    ''' Searches pos to depths 1, 2, ... max_depth and returns the (value, move) of the
+        deepest completed iteration.  Each iteration follows the previous PV first.
+        Depth 1 always completes; deeper iterations are abandoned at the deadline.
+        With a window, each iteration first searches (value - window, value + window)
+        around the previous value, and again with a full window if the result
+        falls outside it.
+
+        pos -- a nonterminal position
+        max_depth -- the deepest iteration to try
+        h -- a Heuristic
+        deadline -- time.perf_counter() value to stop at
+        tt -- a TranspositionTable
+        ordering -- a MoveOrdering, or None
+        search -- a function with alphabeta's arguments (alphabeta if None)
+        window -- aspiration window half-width, or None
+    '''
+    if search is None:
+        search = alphabeta
+    start = time.perf_counter()
+    value, move = search(pos, 1, h, -h.inf, h.inf, tt, ordering=ordering)
+    for depth in range(2, max_depth + 1):
+        now = time.perf_counter()
+        # a proven mate can't improve, and an iteration that started after half
+        # the budget has gone is unlikely to finish
+        if value > MATE_BOUND or now - start > (deadline - start) / 2:
+            break
+        pv = principal_variation(pos, tt, depth - 1)
+        try:
+            if window is not None:
+                alpha, beta = value - window, value + window
+                result = search(pos, depth, h, alpha, beta, tt, ordering=ordering, deadline=deadline, pv=pv)
+                if alpha < result[0] < beta:
+                    value, move = result
+                    continue
+            value, move = search(pos, depth, h, -h.inf, h.inf, tt,
+                                 ordering=ordering, deadline=deadline, pv=pv)
+        except SearchTimeout:
+            break
+    return value, move
+
+
+def value_to_tt(value, ply):
+    ''' Returns value as stored in a transposition table: mate scores counted from
+        the node instead of the root, so they hold wherever the node is reached.
+    '''
+    return value + ply if value > MATE_BOUND else value
+
+
+def value_from_tt(value, ply):
+    ''' Inverse of value_to_tt for a node ply plies from the root.
+    '''
+    return value - ply if value > MATE_BOUND else value
+
+
+def table_key(pos, tt):
+    ''' Returns (key, symmetry): the key pos is stored under in tt, and the symmetry
+        that maps the moves stored there to moves of pos.
+    '''
+    if tt.symmetric:
+        return canonical_position_key(pos)
+    return position_key(pos), 0
+
+
+def move_rank(pos, move, pv_move=None):
+    ''' Returns the rank of a move of pos for breaking ties: of several moves with
+        the same value, a search returns the lowest ranked, so that which one it
+        returns doesn't depend on the order it searched them in, which its table and
+        move ordering decide.  The expected move (on the last PV) ranks first, then
+        the white moves MoveOrdering puts first among quiet ones (checks, then those
+        that take more squares from the black king), then the lowest squares.
+    '''
+    gain, check = white_move_effects(pos.squares(), move) if pos.actor() == 0 else (0, False)
+    return (move != pv_move, -check, -gain, move.from_square, move.to_square)
+
+
+def principal_variation(pos, tt, depth):
+    ''' Returns the line of best moves from pos stored in tt, at most depth moves long.
+    '''
+    pv = []
+    while len(pv) < depth and not pos.is_terminal():
+        key, symmetry = table_key(pos, tt)
+        entry = tt.probe(key)
+        if entry is None:
+            break
+        move = transform_move(entry[3], symmetry)
+        if move not in pos.get_actions():
+            break
+        pv.append(move)
+        pos.apply(move)
+    for _ in pv:
+        pos.undo()
+    return pv
+
+
+def enter_node(pos, depth, h, alpha, beta, tt, ply, deadline, stats):
+    ''' The start of a node of alphabeta or pvs: checks the deadline, counts the
+        node, and decides it without searching if it is terminal, a leaf or repeated,
+        if nothing below it can beat alpha, or if its table entry does.
+
+        Returns (result, hash_move, node): the (value, move) to return, or None if the
+        node must be searched; the move stored for it in tt, or None; and what
+        store_node needs to cache its search (None without a table).
+
+        Arguments are alphabeta's.
+    '''
+    if deadline is not None and time.perf_counter() > deadline:
+        raise SearchTimeout()
+
+    count = pos.history.get(pos.key, 0)
+    if tt is not None and count >= 2:
+        # this score depends on the path, so nothing above it may be cached
+        tt.rep_scores += 1
+    if stats is not None:
+        stats.count_node(pos, depth, count)
 
-    board = pos.board
-    key = board._transposition_key()
-    count = pos.history.get(key, 0)
     if pos.is_terminal():
         p = pos.payoff()
         # discourage draw since we keep getting so many
         if p == 0.0:
-            return -1000.0, None
-        return p * 1000.0, None
-    
+            return (-1000.0, None), None, None
+        # a faster mate is worth more
+        return (p * (MATE - ply), None), None, None
+
     if depth == 0:
-        return h.evaluate(pos), None
-    
-    if count == 3:   
-        return -1000.0, None
+        return (h.evaluate(pos), None), None, None
+
+    if count == 3:
+        return (-1000.0, None), None, None
     if count == 2:
-        return -250.0, None
+        return (-250.0, None), None, None
+
+    # nothing below can beat mate on the next ply, so if alpha already does (a
+    # shorter mate was found elsewhere) there is nothing to search for
+    if ply > 0 and MATE - (ply + 1) <= alpha:
+        return (MATE - (ply + 1), None), None, None
+
+    # look up earlier searches of this position (never cut off at the root,
+    # which must return a move)
+    if tt is None:
+        return None, None, None
+    hash_move = None
+    key, symmetry = table_key(pos, tt)
+    entry = tt.probe(key)
+    if entry is not None:
+        value, entry_depth, flag, entry_move = entry
+        value = value_from_tt(value, ply)
+        entry_move = transform_move(entry_move, symmetry)
+        hash_move = entry_move
+        if entry_depth >= depth and ply > 0:
+            if flag == EXACT:
+                return (value, entry_move), hash_move, None
+            if flag == LOWER and value >= beta:
+                return (value, entry_move), hash_move, None
+            if flag == UPPER and value <= alpha:
+                return (value, entry_move), hash_move, None
+    return None, hash_move, (key, symmetry, alpha, beta, tt.rep_scores)
+
+
+def store_node(tt, node, value, move, depth, ply):
+    ''' Caches the value and best move of a node searched after enter_node returned
+        node for it, unless a repetition was scored somewhere below; then only the
+        move is kept (see TranspositionTable.store_move).
+    '''
+    if node is None:
+        return
+    key, symmetry, alpha, beta, rep_scores = node
+    if value <= alpha:
+        flag = UPPER
+    elif value >= beta:
+        flag = LOWER
+    else:
+        flag = EXACT
+    if tt.rep_scores == rep_scores:
+        tt.store(key, value_to_tt(value, ply), depth, flag, transform_move(move, symmetry))
+    else:
+        tt.store_move(key, value_to_tt(value, ply), flag, transform_move(move, symmetry))
+
+
+def alphabeta(pos, depth, h, alpha, beta, tt=None, ply=0, ordering=None, deadline=None, pv=None, pruning=None,
+              stats=None):
+    # if d>0 and s is not terminal, returns
+    # 1) m = minimax(s, d, h) if 𝜶 ≤ 𝒎 ≤ 𝜷
+    # 2) upper bound a s.t. 𝒎 ≤ 𝒂 ≤ 𝜶 if 𝒎 < 𝜶
+    # 3) lower bound b s.t. 𝜷 ≤ 𝒃 ≤ 𝒎 if 𝒎 > 𝜷
+
+    # if s is terminal then return value determined by rules
+    # if d == 0 then return h(s)
+    result, hash_move, node = enter_node(pos, depth, h, alpha, beta, tt, ply, deadline, stats)
+    if result is not None:
+        return result
+
+    # on the previous iteration's PV, its move goes first
+    pv_move = pv[ply] if pv is not None and ply < len(pv) else None
+    if pv_move is not None:
+        hash_move = pv_move
 
     # S <- set of states reachable in one move from s
     moves = pos.get_actions()
+    if ordering is not None:
+        moves = ordering.order(pos, moves, ply, hash_move)
+    elif hash_move is not None and hash_move in moves:
+        moves = [hash_move] + [move for move in moves if move != hash_move]
+
+    # at the frontier, score all the children in one batch; the cutoff loops below
+    # then only read the values
+    leaf_values = None
+    if depth == 1 and h.batch is not None:
+        leaf_values, leaf_repeated = h.evaluate_batch(pos, moves)
+        if stats is not None:
+            stats.count_batch(moves)
+
+    # near the horizon, quiet white moves that can't reach alpha aren't searched
+    futility_bound = None
+    if pruning is not None and leaf_values is None:
+        futility_bound = pruning.futile(pos, depth, alpha, h)
 
     # if P1 moves at s (max node)
     if pos.actor() == 0:
@@ -46,25 +439,58 @@ def alphabeta(pos, depth, h, alpha, beta):
         best_move = None
 
         # for each s’ in S and while 𝜶 < 𝜷
-        for move in moves:
-            if alpha >= beta:
-                break
-
+        for i, move in enumerate(moves):
+            pruned = False
             # a <- max(a, alphabeta(s’, d – 1, h , 𝜶, 𝜷))
-            child = pos.successor(move)
-
-            mm, _ = alphabeta(child, depth - 1, h, alpha, beta)
-
+            if leaf_values is not None:
+                mm = leaf_values[i]
+                if mm > MATE_BOUND:
+                    # evaluate scores every mate flat
+                    mm = MATE - (ply + 1)
+                if tt is not None and leaf_repeated[i]:
+                    tt.rep_scores += 1
+            elif futility_bound is not None and i > 0 and pruning.quiet(pos, move):
+                pruning.futility_prunes += 1
+                mm = futility_bound
+                pruned = True
+            else:
+                child_pv = pv if move == pv_move else None
+                reduction = pruning.reduction(pos, move, i, depth) if pruning is not None else 0
+                pos.apply(move)
+                try:
+                    mm, _ = alphabeta(pos, depth - 1 - reduction, h, alpha, beta, tt, ply + 1, ordering, deadline, child_pv, pruning, stats)
+                    if reduction and mm > alpha:
+                        # the late move looks better than expected; search it properly
+                        pruning.researches += 1
+                        mm, _ = alphabeta(pos, depth - 1, h, alpha, beta, tt, ply + 1, ordering, deadline, child_pv, pruning, stats)
+                finally:
+                    pos.undo()
 
             if mm > a:
                 a = mm
                 best_move = move
+            elif mm == a == alpha and not pruned and move_rank(pos, move, pv_move) < move_rank(pos, best_move, pv_move):
+                # of equal moves the lowest ranked wins; a search that stopped at alpha
+                # only bounds the move, so it is searched again just below alpha
+                if leaf_values is None:
+                    pos.apply(move)
+                    try:
+                        mm, _ = alphabeta(pos, depth - 1, h, math.nextafter(alpha, -h.inf), beta, tt, ply + 1, ordering, deadline, child_pv, pruning, stats)
+                    finally:
+                        pos.undo()
+                if mm == a:
+                    best_move = move
 
             # 𝜶 <- max(𝜶, a)
             alpha = max(alpha, a)
+            if alpha >= beta:
+                if ordering is not None:
+                    ordering.cutoff(move, i, depth, ply)
+                if stats is not None:
+                    stats.cutoff(i)
+                break
 
-        # return a
-        return a, best_move
+        value = a
     
     # else (min node)
     else:
@@ -73,19 +499,51 @@ def alphabeta(pos, depth, h, alpha, beta):
         best_move = None
 
         # for each s’ in S and while 𝜶 < 𝜷
-        for move in moves:
-            if alpha >= beta:
-                break
-
+        for i, move in enumerate(moves):
             # b <- min(b, alphabeta(s’, d – 1, h , 𝜶, 𝜷))
-            child = pos.successor(move)
-            mm, _ = alphabeta(child, depth - 1, h, alpha, beta)
+            if leaf_values is not None:
+                mm = leaf_values[i]
+                if mm > MATE_BOUND:
+                    # evaluate scores every mate flat
+                    mm = MATE - (ply + 1)
+                if tt is not None and leaf_repeated[i]:
+                    tt.rep_scores += 1
+            else:
+                child_pv = pv if move == pv_move else None
+                reduction = pruning.reduction(pos, move, i, depth) if pruning is not None else 0
+                pos.apply(move)
+                try:
+                    mm, _ = alphabeta(pos, depth - 1 - reduction, h, alpha, beta, tt, ply + 1, ordering, deadline, child_pv, pruning, stats)
+                    if reduction and mm < beta:
+                        pruning.researches += 1
+                        mm, _ = alphabeta(pos, depth - 1, h, alpha, beta, tt, ply + 1, ordering, deadline, child_pv, pruning, stats)
+                finally:
+                    pos.undo()
             if mm < b:
                 b = mm
                 best_move = move
+            elif mm == b == beta and move_rank(pos, move, pv_move) < move_rank(pos, best_move, pv_move):
+                if leaf_values is None:
+                    pos.apply(move)
+                    try:
+                        mm, _ = alphabeta(pos, depth - 1, h, alpha, math.nextafter(beta, h.inf), tt, ply + 1, ordering, deadline, child_pv, pruning, stats)
+                    finally:
+                        pos.undo()
+                if mm == b:
+                    best_move = move
 
             # 𝜷 <- min(𝜷, b)
             beta = min(beta, b)
+            if alpha >= beta:
+                if ordering is not None:
+                    ordering.cutoff(move, i, depth, ply)
+                if stats is not None:
+                    stats.cutoff(i)
+                break
+
+        value = b
+
+    store_node(tt, node, value, best_move, depth, ply)
 
-        # return b
-        return b, best_move
+    # return a (max node) or b (min node)
+    return value, best_move
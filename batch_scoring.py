@@ -0,0 +1,89 @@
+import numpy as np
+
+from scoring import CHEBYSHEV, CORNER_DISTANCE, EDGE_DISTANCE, MANHATTAN, SQUARE_COLOR, evaluate
+from tablebase import KING_ADJ, KING_STEPS, KNIGHT_ADJ, bishop_sees
+
+# scoring's lookup tables as arrays
+CORNER = np.array(CORNER_DISTANCE)
+COLOR = np.array(SQUARE_COLOR)
+EDGE = np.array(EDGE_DISTANCE)
+MANHATTAN_ARRAY = np.array(MANHATTAN)
+CHEBYSHEV_ARRAY = np.array(CHEBYSHEV)
+
+
+def king_mobility_batch(wk, bk, wb, wn):
+    ''' scoring.king_mobility over arrays of squares.
+    '''
+    mobility = np.zeros(len(bk), dtype=np.int64)
+    for k in range(8):
+        to = KING_STEPS[bk, k]
+        ok = to >= 0
+        to = np.where(ok, to, 0)
+        attacked = KING_ADJ[wk, to] | KNIGHT_ADJ[wn, to] | bishop_sees(wb, to, wk, wn)
+        mobility += ok & ~attacked
+    return mobility
+
+
+def evaluate_squares(wk, bk, wb, wn, black_to_move, clock):
+    ''' scoring.evaluate over arrays describing nonterminal, unrepeated positions.
+        Returns the same floats, in the same order.
+    '''
+    cornering_score = 1 - (CORNER[COLOR[wb], bk] / 7)
+
+    ed = EDGE[bk]
+    edge_score = 1 - (ed / 3)
+
+    kings_distance_score = 1 - (CHEBYSHEV_ARRAY[wk, bk] / 7)
+
+    mobility = np.where(black_to_move, king_mobility_batch(wk, bk, wb, wn), 0)
+    restrictiveness_score = 1 - (mobility / 8)
+
+    average_distance = (MANHATTAN_ARRAY[wk, wb] + MANHATTAN_ARRAY[wk, wn] + MANHATTAN_ARRAY[wb, wn]) / 3
+    coordination_score = 1 - (average_distance / 14)
+
+    urgency_penalty = clock / 100.0
+
+    near_edge = ed <= 1
+    corner_weight = np.where(near_edge, 0.35, 0.25)
+    edge_weight = np.where(near_edge, 0.10, 0.15)
+
+    return (
+        corner_weight * cornering_score +
+        edge_weight * edge_score +
+        0.25 * restrictiveness_score +
+        0.10 * coordination_score +
+        0.25 * kings_distance_score -
+        .15 * urgency_penalty
+        )
+
+
+def evaluate_children(pos, moves):
+    ''' Scores the position after each of moves as scoring.evaluate would.  Terminal
+        and repeated positions are scored one at a time by evaluate; the rest in one
+        call to evaluate_squares.
+
+        Returns (values, repeated, nonterminal): the scores in the order of moves, which
+        of the children are repeated positions, and how many are not terminal.
+    '''
+    values = [None] * len(moves)
+    repeated = [False] * len(moves)
+    rows = []
+    nonterminal = 0
+    for i, move in enumerate(moves):
+        pos.apply(move)
+        count = pos.history.get(pos.key, 0)
+        repeated[i] = count >= 2
+        terminal = pos.is_terminal()
+        if not terminal:
+            nonterminal += 1
+        if terminal or count >= 2:
+            values[i] = evaluate(pos)
+        else:
+            rows.append((i, *pos.squares(), pos.actor() == 1, pos.halfmove_clock()))
+        pos.undo()
+
+    if rows:
+        index, wk, bk, wb, wn, black_to_move, clock = (np.array(column) for column in zip(*rows))
+        for i, value in zip(index.tolist(), evaluate_squares(wk, bk, wb, wn, black_to_move, clock).tolist()):
+            values[i] = value
+    return values, repeated, nonterminal
@@ -0,0 +1,171 @@
+"""
+Search benchmark: every engine to fixed depths over a fixed position set.
+
+    python bench.py [--engines minimax:3 alphabeta:5] [--suite random200] [--positions 20]
+                    [--json bench.json] [--baseline old.json] [--threshold 0.10]
+
+Each engine searches every position from a cold start (new heuristic, table and
+ordering) at each depth from 1 to its maximum.  For each (engine, depth) it
+reports nodes (moves played by the search), heuristic calls, time, nodes per
+second and the move chosen in every position.  The time of depth d is the time
+to depth d: the fixed-depth search to d, summed over the positions.
+
+With --baseline, results are compared with a saved run (same engines, suite and
+positions) and the exit status is 1 if any (engine, depth) took more than
+threshold longer than the baseline (ignoring those under MIN_TIME seconds).
+"""
+
+import argparse
+import json
+import sys
+import time
+
+from alphabeta import alphabeta
+from chess_bnk import ChessBNKState
+from kbnk import KBNKState
+from minimax import Heuristic, minimax
+from ordering import MoveOrdering
+from pvs import pvs
+from scoring import evaluate
+from start_positions import load_suite
+from transposition import TranspositionTable
+
+ENGINES = ("minimax", "alphabeta", "pvs")
+
+# results faster than this (seconds) in the baseline are too noisy to fail on
+MIN_TIME = 0.1
+
+
+def counting(state):
+    ''' Returns a subclass of the state class state whose apply counts the nodes
+        searched in the class attribute nodes.
+    '''
+    class Counting(state):
+        __slots__ = ()
+        nodes = 0
+
+        def apply(self, action):
+            Counting.nodes += 1
+            super().apply(action)
+    return Counting
+
+
+def search(engine, pos, depth, h, tt):
+    ''' Returns the (value, move) of one search of pos to depth.
+    '''
+    if engine == "minimax":
+        return minimax(pos, depth, h)
+    fxn = alphabeta if engine == "alphabeta" else pvs
+    return fxn(pos, depth, h, -h.inf, h.inf, tt, ordering=MoveOrdering())
+
+
+def run(engine, max_depth, roots, tt_mb=16, repeat=1):
+    ''' Returns a result dict for each depth 1..max_depth of engine over the roots,
+        with the best time of repeat runs.
+    '''
+    state = type(roots[0])
+    results = []
+    for depth in range(1, max_depth + 1):
+        best = None
+        for _ in range(repeat):
+            h = Heuristic(evaluate)
+            state.nodes = 0
+            moves = []
+            elapsed = 0.0
+            for pos in roots:
+                tt = TranspositionTable(tt_mb) if tt_mb > 0 and engine != "minimax" else None
+                t0 = time.perf_counter()
+                _, move = search(engine, pos, depth, h, tt)
+                elapsed += time.perf_counter() - t0
+                moves.append(move.uci() if move is not None else None)
+            if best is None or elapsed < best["time"]:
+                best = {
+                    "engine": engine,
+                    "depth": depth,
+                    "nodes": state.nodes,
+                    "calls": h.count_calls(),
+                    "time": elapsed,
+                    "nps": state.nodes / elapsed if elapsed else 0.0,
+                    "moves": moves,
+                }
+        results.append(best)
+    return results
+
+
+def compare(results, baseline, threshold):
+    ''' Prints each result against the baseline and returns the (engine, depth)
+        pairs that slowed down by more than threshold.
+    '''
+    old = {(r["engine"], r["depth"]): r for r in baseline["results"]}
+    slower = []
+    for r in results:
+        b = old.get((r["engine"], r["depth"]))
+        if b is None:
+            continue
+        ratio = r["time"] / b["time"] if b["time"] else 1.0
+        changed = sum(m != n for m, n in zip(r["moves"], b["moves"]))
+        flag = ""
+        if ratio > 1 + threshold and b["time"] >= MIN_TIME:
+            slower.append((r["engine"], r["depth"]))
+            flag = "  SLOWER"
+        print(f"{r['engine']:>9} depth {r['depth']}: time {ratio:.2f}x, nodes {r['nodes']} vs {b['nodes']}, "
+              f"calls {r['calls']} vs {b['calls']}, {changed} moves changed{flag}")
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the search engines at fixed depths.")
+    parser.add_argument("--engines", type=str, nargs="+", default=["minimax:3", "alphabeta:5"],
+                        help="engine:max_depth pairs, engines from " + ", ".join(ENGINES))
+    parser.add_argument("--suite", type=str, default="random200", help="Position suite in suites/")
+    parser.add_argument("--positions", type=int, default=20, help="Number of suite positions to search")
+    parser.add_argument("--native", action="store_true", help="Search on KBNKState instead of chess.Board")
+    parser.add_argument("--tt-mb", type=float, default=16, help="Transposition table size in MB (0 disables)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per depth; the fastest is kept")
+    parser.add_argument("--json", type=str, default=None, help="Write the results to this file")
+    parser.add_argument("--baseline", type=str, default=None, help="Compare with the results in this file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Largest allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    state = counting(KBNKState if args.native else ChessBNKState)
+    boards = load_suite(args.suite)[:args.positions]
+    if args.native:
+        roots = [state.from_board(board) for board in boards]
+    else:
+        roots = [state(board) for board in boards]
+
+    results = []
+    for spec in args.engines:
+        engine, max_depth = spec.split(":")
+        if engine not in ENGINES:
+            parser.error(f"unknown engine {engine}")
+        for r in run(engine, int(max_depth), roots, args.tt_mb, args.repeat):
+            results.append(r)
+            print(f"{engine:>9} depth {r['depth']}: {r['nodes']:>9} nodes {r['calls']:>9} calls "
+                  f"{r['time']:8.3f}s {r['nps']:>9.0f} nodes/s")
+
+    report = {
+        "suite": args.suite,
+        "positions": len(roots),
+        "native": args.native,
+        "tt_mb": args.tt_mb,
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline["suite"], baseline["positions"], baseline["native"]) != (args.suite, len(roots), args.native):
+            print("Baseline was run on a different position set")
+            sys.exit(2)
+        slower = compare(results, baseline, args.threshold)
+        if slower:
+            print(f"Slower than the baseline by more than {args.threshold * 100:.0f}%: {slower}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
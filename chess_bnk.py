@@ -1,58 +1,133 @@
 import chess
 from game import Game, State
 import random
+from transposition import zobrist_hash, update_hash
+
+# marks a cached value that has not been computed yet
+UNKNOWN = object()
 
 class ChessBNKState(State):
-    def __init__(self, board: chess.Board, history=None):
+    def __init__(self, board: chess.Board, history=None, key=None):
         self.board = board
+        # history counts positions by zobrist hash
+        self.key = zobrist_hash(board) if key is None else key
         if history is None:
             self.history = {}
-            k = board._transposition_key()
-            self.history[k] = 1
+            self.history[self.key] = 1
         else:
             self.history = history
+        # legal moves and terminal reason, computed at most once per position
+        self._actions = None
+        self._reason = UNKNOWN
+        # key and cached values of the positions apply has moved away from
+        self._undo = []
+
+    def terminal_reason(self):
+        ''' Returns why this position ends the game: "checkmate", "stalemate",
+            "insufficient_material", "fifty_move_rule" or "threefold_repetition",
+            or None if it is not terminal.
+        '''
+        if self._reason is UNKNOWN:
+            self._reason = self._find_terminal_reason()
+        return self._reason
+
+    def _find_terminal_reason(self):
+        board = self.board
+        moves = self.get_actions()
+        if not moves:
+            return "checkmate" if board.is_check() else "stalemate"
+
+        if board.is_insufficient_material():
+            return "insufficient_material"
+
+        # same as board.can_claim_fifty_moves(), reusing our move list
+        if board.halfmove_clock >= 100:
+            return "fifty_move_rule"
+        if board.halfmove_clock >= 99:
+            for move in moves:
+                if not board.is_zeroing(move):
+                    board.push(move)
+                    try:
+                        if any(board.generate_legal_moves()):
+                            return "fifty_move_rule"
+                    finally:
+                        board.pop()
+
+        if self.history.get(self.key, 0) >= 3:
+            return "threefold_repetition"
+
+        return None
 
     def is_terminal(self):
-        if self.board.is_checkmate() or self.board.is_stalemate():
-            return True
-        
-        if self.board.can_claim_fifty_moves() or self.board.is_fifty_moves():
-            return True
-
-        key = self.board._transposition_key()
-        count = self.history.get(key, 0)
-        
-        if self.board.is_insufficient_material() or count >= 3:
-            return True
-        
-        return False
+        return self.terminal_reason() is not None
 
     def payoff(self):
-        if self.board.is_checkmate():
+        if self.terminal_reason() == "checkmate":
             return 1.0 if self.board.turn == chess.BLACK else -1.0
         
         return 0.0
 
+    def squares(self):
+        ''' Returns the squares of the white king, black king, white bishop and white
+            knight (None for a captured piece).
+        '''
+        b = self.board
+        bishops = b.pieces_mask(chess.BISHOP, chess.WHITE)
+        knights = b.pieces_mask(chess.KNIGHT, chess.WHITE)
+        return (b.king(chess.WHITE), b.king(chess.BLACK),
+                chess.lsb(bishops) if bishops else None,
+                chess.lsb(knights) if knights else None)
+
+    def halfmove_clock(self):
+        return self.board.halfmove_clock
+
     def actor(self):
         return 0 if self.board.turn == chess.WHITE else 1
 
     def get_actions(self):
-        return list(self.board.legal_moves)
+        # the list is shared between calls, so callers must not modify it
+        if self._actions is None:
+            self._actions = list(self.board.legal_moves)
+        return self._actions
 
     def successor(self, action):
+        k2 = update_hash(self.key, self.board, action)
         b2 = self.board.copy(stack=True)
         b2.push(action)
 
-        k2 = b2._transposition_key()
         history2 = self.history.copy()
         history2[k2] = history2.get(k2, 0) + 1
-        return ChessBNKState(b2, history2)
+        return ChessBNKState(b2, history2, k2)
+
+    def apply(self, action):
+        self._undo.append((self.key, self._actions, self._reason))
+        self.key = update_hash(self.key, self.board, action)
+        self.board.push(action)
+        self.history[self.key] = self.history.get(self.key, 0) + 1
+        self._actions = None
+        self._reason = UNKNOWN
+
+    def undo(self):
+        count = self.history[self.key] - 1
+        if count:
+            self.history[self.key] = count
+        else:
+            del self.history[self.key]
+        self.board.pop()
+        self.key, self._actions, self._reason = self._undo.pop()
 
 class ChessBNKGame(Game):
-    def __init__(self, seed=None):
+    def __init__(self, seed=None, starts=None):
+        # starts -- optional start_positions.StartIndex to draw from in one step
+        # instead of rejection sampling (a seed then gives a different position)
         self.rng = random.Random(seed)
+        self.starts = starts
 
     def _random_bnk_position(self):
+        if self.starts is not None:
+            from start_positions import to_board
+            return to_board(*self.starts.sample(self.rng))
+
         for _ in range(1000):
             board = chess.Board()
             board.clear_board()
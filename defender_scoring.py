@@ -1,8 +1,15 @@
 import chess
+from kbnk import BK_KEYS, BB, KING_ATTACKS, KBNKState, MOVES, _scan_reversed, white_attacks
 from scoring import distance_to_target_corner
+from transposition import ZOBRIST_TURN
 
-def can_make_capture(board):
-    for mv in board.legal_moves:
+# distance_to_target_corner by bishop square colour and black king square
+TARGET_CORNER_DISTANCE = [[distance_to_target_corner(sq, bishop) for sq in chess.SQUARES]
+                          for bishop in (chess.A1, chess.B1)]
+
+def can_make_capture(pos):
+    board = pos.board
+    for mv in pos.get_actions():
         if board.is_capture(mv):
             return True 
     return False
@@ -15,13 +22,12 @@ def defender_eval(pos):
         return -1000.0
     
     b = pos.board
-    key = b._transposition_key()
-    count = pos.history.get(key, 0)
+    count = pos.history.get(pos.key, 0)
 
     if count == 3:
         return 1000.0
     
-    if can_make_capture(b):
+    if can_make_capture(pos):
         return 1000.0
     
     b_king = b.king(chess.BLACK)
@@ -29,4 +35,52 @@ def defender_eval(pos):
     w_bishop = bishops[0]
     dist = distance_to_target_corner(b_king, w_bishop)
     return dist
-    
\ No newline at end of file
+    
+def score_king_moves(pos):
+    ''' Returns (moves, values): the legal moves of pos, a black-to-move position
+        with all white pieces on the board, in python-chess order, and
+        defender_eval of the position after each.  Moves are generated from
+        attack masks and scored without playing them; only positions where the
+        fifty-move rule may end the game are played out.
+    '''
+    wk, bk, wb, wn = pos.squares()
+    clock = pos.halfmove_clock() + 1
+    key = pos.key ^ BK_KEYS[bk] ^ ZOBRIST_TURN
+    history = pos.history
+    corner = TARGET_CORNER_DISTANCE[(chess.square_file(wb) + chess.square_rank(wb)) % 2]
+    occupied = BB[wk] | BB[wb] | BB[wn]
+    row = MOVES[bk]
+
+    moves = []
+    values = []
+    for to in _scan_reversed(KING_ATTACKS[bk] & ~KING_ATTACKS[wk]):
+        b = wb if wb != to else None
+        n = wn if wn != to else None
+        if white_attacks(to, wk, b, n, occupied | BB[to]):
+            continue
+        move = row[to]
+        moves.append(move)
+        if b is None or n is None:
+            # a capture leaves insufficient material
+            values.append(1000.0)
+        elif clock >= 99:
+            pos.apply(move)
+            values.append(defender_eval(pos))
+            pos.undo()
+        elif history.get(key ^ BK_KEYS[to], 0) >= 2:
+            # the third occurrence
+            values.append(1000.0)
+        else:
+            values.append(corner[to])
+
+    if KBNKState.cross_check:
+        expected = pos.get_actions()
+        if moves != expected:
+            raise AssertionError(f"king moves differ: {moves} != {expected}")
+        for move, value in zip(moves, values):
+            pos.apply(move)
+            slow = defender_eval(pos)
+            pos.undo()
+            if slow != value:
+                raise AssertionError(f"defender score of {move} differs: {value} != {slow}")
+    return moves, values
@@ -68,3 +68,23 @@ class State(ABC):
             action -- one of the actions in the list returned by get_actions for this state
         """
         pass
+
+
+    @abstractmethod
+    def apply(self, action):
+        """ Plays the given action on this state in place.  Cheaper than successor
+            for search, which must call undo to restore the state afterwards.
+
+            self -- a nonterminal state
+            action -- one of the actions in the list returned by get_actions for this state
+        """
+        pass
+
+
+    @abstractmethod
+    def undo(self):
+        """ Takes back the last action played with apply.
+
+            self -- a state that apply has been called on
+        """
+        pass
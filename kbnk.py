@@ -0,0 +1,307 @@
+import chess
+from game import State
+from chess_bnk import UNKNOWN
+from transposition import ZOBRIST, ZOBRIST_TURN
+
+# attack tables, indexed by square (bishop attacks also by blocker mask)
+KING_ATTACKS = chess.BB_KING_ATTACKS
+KNIGHT_ATTACKS = chess.BB_KNIGHT_ATTACKS
+DIAG_ATTACKS = chess.BB_DIAG_ATTACKS
+DIAG_MASKS = chess.BB_DIAG_MASKS
+BB = chess.BB_SQUARES
+
+# polyglot piece keys per square
+WK_KEYS = ZOBRIST[64 * 11:64 * 12]
+BK_KEYS = ZOBRIST[64 * 10:64 * 11]
+WB_KEYS = ZOBRIST[64 * 5:64 * 6]
+WN_KEYS = ZOBRIST[64 * 3:64 * 4]
+
+# one shared Move object per (from, to), so move generation allocates nothing
+MOVES = [[chess.Move(frm, to) for to in chess.SQUARES] for frm in chess.SQUARES]
+
+
+def bishop_attacks(sq, occupied):
+    ''' Returns the bitboard of squares a bishop on sq attacks, given the occupied squares.
+    '''
+    return DIAG_ATTACKS[sq][DIAG_MASKS[sq] & occupied]
+
+
+def white_attacks(sq, wk, wb, wn, occupied):
+    ''' Determines if any white piece attacks sq.  Captured pieces are None.
+
+        occupied -- occupied squares, without the black king if it is the piece moving
+    '''
+    bb = BB[sq]
+    if KING_ATTACKS[wk] & bb:
+        return True
+    if wn is not None and KNIGHT_ATTACKS[wn] & bb:
+        return True
+    if wb is not None and bishop_attacks(wb, occupied) & bb:
+        return True
+    return False
+
+
+def _scan_reversed(bb):
+    # squares of a bitboard, highest first (python-chess's move order)
+    while bb:
+        sq = bb.bit_length() - 1
+        yield sq
+        bb ^= 1 << sq
+
+
+class KBNKState(State):
+    ''' A compact KBNK position: four squares, side to move, halfmove clock and a
+        flag for whether black has captured a piece.  Generates moves from attack
+        tables instead of going through chess.Board.  Repetitions are counted in
+        history by the same polyglot hash ChessBNKState uses.
+
+        Set KBNKState.cross_check to True to compare every move list, terminal
+        test and payoff against python-chess.
+    '''
+    __slots__ = ("wk", "bk", "wb", "wn", "white", "clock", "captured", "key", "history",
+                 "_actions", "_reason", "_undo")
+
+    cross_check = False
+
+    def __init__(self, wk, bk, wb, wn, white=True, clock=0, history=None):
+        self.wk = wk
+        self.bk = bk
+        self.wb = wb
+        self.wn = wn
+        self.white = white
+        self.clock = clock
+        self.captured = wb is None or wn is None
+        self.key = self._hash()
+        if history is None:
+            history = {self.key: 1}
+        self.history = history
+        self._actions = None
+        self._reason = UNKNOWN
+        self._undo = []
+
+    @classmethod
+    def from_board(cls, board, history=None):
+        ''' Returns the KBNKState for a board holding at most white king, bishop and
+            knight and black king.
+        '''
+        bishops = board.pieces_mask(chess.BISHOP, chess.WHITE)
+        knights = board.pieces_mask(chess.KNIGHT, chess.WHITE)
+        return cls(board.king(chess.WHITE), board.king(chess.BLACK),
+                   chess.lsb(bishops) if bishops else None,
+                   chess.lsb(knights) if knights else None,
+                   board.turn == chess.WHITE, board.halfmove_clock, history)
+
+    @classmethod
+    def from_state(cls, pos):
+        ''' Returns a KBNKState for a ChessBNKState, with a copy of its history.
+        '''
+        return cls.from_board(pos.board, dict(pos.history))
+
+    def to_board(self):
+        ''' Returns this position as a chess.Board (without move history).
+        '''
+        board = chess.Board(None)
+        board.set_piece_at(self.wk, chess.Piece(chess.KING, chess.WHITE))
+        board.set_piece_at(self.bk, chess.Piece(chess.KING, chess.BLACK))
+        if self.wb is not None:
+            board.set_piece_at(self.wb, chess.Piece(chess.BISHOP, chess.WHITE))
+        if self.wn is not None:
+            board.set_piece_at(self.wn, chess.Piece(chess.KNIGHT, chess.WHITE))
+        board.turn = chess.WHITE if self.white else chess.BLACK
+        board.halfmove_clock = self.clock
+        return board
+
+    def _hash(self):
+        key = WK_KEYS[self.wk] ^ BK_KEYS[self.bk]
+        if self.wb is not None:
+            key ^= WB_KEYS[self.wb]
+        if self.wn is not None:
+            key ^= WN_KEYS[self.wn]
+        if self.white:
+            key ^= ZOBRIST_TURN
+        return key
+
+    def squares(self):
+        return self.wk, self.bk, self.wb, self.wn
+
+    def halfmove_clock(self):
+        return self.clock
+
+    def occupied(self):
+        occ = BB[self.wk] | BB[self.bk]
+        if self.wb is not None:
+            occ |= BB[self.wb]
+        if self.wn is not None:
+            occ |= BB[self.wn]
+        return occ
+
+    def is_check(self):
+        ''' Determines if the side to move is in check (only black can be).
+        '''
+        if self.white:
+            return False
+        return white_attacks(self.bk, self.wk, self.wb, self.wn, self.occupied())
+
+    def _moves(self):
+        wk, bk, wb, wn = self.wk, self.bk, self.wb, self.wn
+        occupied = self.occupied()
+
+        if self.white:
+            ours = occupied & ~BB[bk]
+            moves = []
+            # python-chess order: from squares high to low, then targets high to low
+            for frm in sorted((sq for sq in (wk, wb, wn) if sq is not None), reverse=True):
+                if frm == wk:
+                    targets = KING_ATTACKS[wk] & ~KING_ATTACKS[bk]
+                elif frm == wn:
+                    targets = KNIGHT_ATTACKS[wn]
+                else:
+                    targets = bishop_attacks(wb, occupied)
+                row = MOVES[frm]
+                moves.extend(row[to] for to in _scan_reversed(targets & ~ours & ~BB[bk]))
+            return moves
+
+        # black king: may take an undefended piece, may not step next to the white king
+        occupied &= ~BB[bk]
+        row = MOVES[bk]
+        moves = []
+        for to in _scan_reversed(KING_ATTACKS[bk] & ~KING_ATTACKS[wk]):
+            b = wb if wb != to else None
+            n = wn if wn != to else None
+            if not white_attacks(to, wk, b, n, occupied | BB[to]):
+                moves.append(row[to])
+        return moves
+
+    def get_actions(self):
+        # the list is shared between calls, so callers must not modify it
+        if self._actions is None:
+            self._actions = self._moves()
+            if self.cross_check:
+                expected = list(self.to_board().legal_moves)
+                if self._actions != expected:
+                    raise AssertionError(f"move generation differs on {self.to_board().fen()}: {self._actions} != {expected}")
+        return self._actions
+
+    def is_legal(self, action):
+        return action in self.get_actions()
+
+    def terminal_reason(self):
+        ''' Returns why this position ends the game, as ChessBNKState.terminal_reason
+            does, or None if it is not terminal.
+        '''
+        if self._reason is UNKNOWN:
+            self._reason = self._find_terminal_reason()
+            if self.cross_check:
+                board = self.to_board()
+                expected = (board.is_checkmate() or board.is_stalemate()
+                            or board.can_claim_fifty_moves() or board.is_fifty_moves()
+                            or board.is_insufficient_material()
+                            or self.history.get(self.key, 0) >= 3)
+                if (self._reason is not None) != expected:
+                    raise AssertionError(f"terminal test differs on {board.fen()}: {self._reason} != {expected}")
+                if (self._reason == "checkmate") != board.is_checkmate():
+                    raise AssertionError(f"checkmate test differs on {board.fen()}")
+        return self._reason
+
+    def _find_terminal_reason(self):
+        moves = self.get_actions()
+        if not moves:
+            return "checkmate" if self.is_check() else "stalemate"
+
+        if self.captured:
+            return "insufficient_material"
+
+        if self.clock >= 100:
+            return "fifty_move_rule"
+        if self.clock >= 99:
+            # a non-capture that reaches 100 while leaving the opponent a move
+            for move in moves:
+                if move.to_square in (self.wb, self.wn):
+                    continue
+                self.apply(move)
+                claim = bool(self.get_actions())
+                self.undo()
+                if claim:
+                    return "fifty_move_rule"
+
+        if self.history.get(self.key, 0) >= 3:
+            return "threefold_repetition"
+
+        return None
+
+    def is_terminal(self):
+        return self.terminal_reason() is not None
+
+    def payoff(self):
+        # only black can be mated
+        return 1.0 if self.terminal_reason() == "checkmate" else 0.0
+
+    def actor(self):
+        return 0 if self.white else 1
+
+    def apply(self, action):
+        self._undo.append((self.wk, self.bk, self.wb, self.wn, self.clock, self.captured, self.key,
+                           self._actions, self._reason))
+        self._actions = None
+        self._reason = UNKNOWN
+        frm = action.from_square
+        to = action.to_square
+        key = self.key ^ ZOBRIST_TURN
+        self.clock += 1
+
+        if self.white:
+            if frm == self.wk:
+                self.wk = to
+                key ^= WK_KEYS[frm] ^ WK_KEYS[to]
+            elif frm == self.wb:
+                self.wb = to
+                key ^= WB_KEYS[frm] ^ WB_KEYS[to]
+            else:
+                self.wn = to
+                key ^= WN_KEYS[frm] ^ WN_KEYS[to]
+        else:
+            self.bk = to
+            key ^= BK_KEYS[frm] ^ BK_KEYS[to]
+            if to == self.wb:
+                self.wb = None
+                key ^= WB_KEYS[to]
+                self.captured = True
+                self.clock = 0
+            elif to == self.wn:
+                self.wn = None
+                key ^= WN_KEYS[to]
+                self.captured = True
+                self.clock = 0
+
+        self.white = not self.white
+        self.key = key
+        self.history[key] = self.history.get(key, 0) + 1
+
+    def undo(self):
+        count = self.history[self.key] - 1
+        if count:
+            self.history[self.key] = count
+        else:
+            del self.history[self.key]
+        (self.wk, self.bk, self.wb, self.wn, self.clock, self.captured, self.key,
+         self._actions, self._reason) = self._undo.pop()
+        self.white = not self.white
+
+    def successor(self, action):
+        child = type(self)(self.wk, self.bk, self.wb, self.wn, self.white, self.clock, dict(self.history))
+        child.apply(action)
+        child._undo = []
+        return child
+
+
+def native_policy(policy, state=KBNKState):
+    ''' Wraps a policy so that it searches on a KBNKState (or the given subclass)
+        converted from the ChessBNKState it is given.  The move it returns is an
+        ordinary chess.Move.
+    '''
+    def fxn(pos):
+        return policy(state.from_state(pos))
+    fxn.__dict__.update(policy.__dict__)
+    if hasattr(policy, "ponder"):
+        fxn.ponder = lambda pos: policy.ponder(state.from_state(pos))
+    return fxn
@@ -1,19 +1,36 @@
+from collections import OrderedDict
+
 # from kalah import Kalah
 
 class Heuristic:
     ''' A wrapper for a heuristic function that counts how many times the
         heuristic is called.
     '''
-    def __init__(self, h):
+    def __init__(self, h, batch=None, cache_size=0, cache_key=None):
         ''' Creates a wrapper for the given function.
 
             h -- a heuristic function that takes a game position and returns its heiristic value,
                  or its actual value if the position is terminal.
+            batch -- a function that takes a position and a list of its moves and returns
+                     (values, repeated, nonterminal) for the children, as
+                     batch_scoring.evaluate_children does, or None
+            cache_size -- the number of values to remember, least recently used first out
+                          (0 for no cache); positions need a hash key and history
+            cache_key -- a function returning the hash to cache a position under, pos.key
+                         if None
         '''
         self.calls = 0
         self.heuristic = h
+        self.batch = batch
         self.inf = float("inf") 
 
+        self.cache_size = cache_size
+        self.cache_key = cache_key
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
         
     def evaluate(self, pos):
         ''' Returns the underlying heuristic applied to the given position.
@@ -23,7 +40,40 @@ class Heuristic:
         # calls on terminal positions don't count
         if not pos.is_terminal():
             self.calls += 1
-        return self.heuristic(pos)
+        if not self.cache_size:
+            return self.heuristic(pos)
+
+        # the value also depends on how often the position has been seen and on
+        # the halfmove clock, neither of which is in the hash
+        key = (pos.key if self.cache_key is None else self.cache_key(pos),
+               pos.history.get(pos.key, 0), pos.halfmove_clock())
+        value = self.cache.get(key)
+        if value is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return value
+
+        self.misses += 1
+        value = self.heuristic(pos)
+        self.cache[key] = value
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+        return value
+
+
+    def evaluate_batch(self, pos, moves):
+        ''' Returns (values, repeated): the heuristic applied to the position after each
+            of the given moves, and which of those positions have been seen twice before.
+
+            pos -- a game position
+            moves -- a list of legal moves from pos
+        '''
+        # batched values bypass the cache
+        values, repeated, nonterminal = self.batch(pos, moves)
+        # as in evaluate, only nonterminal positions count
+        self.calls += nonterminal
+        return values, repeated
 
     
     def count_calls(self):
@@ -32,6 +82,12 @@ class Heuristic:
         return self.calls
 
 
+    def cache_stats(self):
+        ''' Returns the cache's hits, misses, evictions and current size.
+        '''
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self.cache)}
+
+
 def seeds_stored_heuristic(pos):
     ''' A simple heuristic for Kalah.  Returns the difference in the number of seeds
         in P1's store vs. P2's store (P1 - P2) unless the position is terminal,
@@ -56,32 +112,47 @@ def seeds_stored_heuristic_soft_winner(pos):
     return pos._seeds_stored(0) - pos._seeds_stored(1)
 
 
-def minimax_policy(depth, h):
+def minimax_policy(depth, h, stats=None):
     def fxn(pos):
-        value, move = minimax(pos, depth, h)
+        value, move = minimax(pos, depth, h, stats)
         return move
+    fxn.h = h
     return fxn
 
 
-def minimax(pos, depth, h):
+def minimax(pos, depth, h, stats=None):
     ''' Returns the minimax value of the given position, with the given heuristic function
         applied at the given depth.
 
         pos -- a game position
         depth -- a nonnegative integer
         h -- a heuristic function that can be applied to pos and all its successors
+        stats -- a search_stats.SearchStats to count nodes in, or None
     '''
+    if stats is not None:
+        stats.count_node(pos, depth, 0)
     if pos.is_terminal() or depth == 0:
         return (h.evaluate(pos), None)
     else:
+        # at the frontier, score all the children in one batch
+        leaf_values = None
+        if depth == 1 and h.batch is not None:
+            leaf_values, _ = h.evaluate_batch(pos, pos.get_actions())
+            if stats is not None:
+                stats.count_batch(pos.get_actions())
+
         if pos.actor() == 0:
             # max player
             best_value = -h.inf
             best_move = None
             moves = pos.get_actions()
-            for move in moves:
-                child = pos.successor(move)
-                mm, _ = minimax(child, depth - 1, h)
+            for i, move in enumerate(moves):
+                if leaf_values is not None:
+                    mm = leaf_values[i]
+                else:
+                    pos.apply(move)
+                    mm, _ = minimax(pos, depth - 1, h, stats)
+                    pos.undo()
                 if mm > best_value:
                     best_value = mm
                     best_move = move
@@ -91,9 +162,13 @@ def minimax(pos, depth, h):
             best_value = h.inf
             best_move = None
             moves = pos.get_actions()
-            for move in moves:
-                child = pos.successor(move)
-                mm, _ = minimax(child, depth - 1, h)
+            for i, move in enumerate(moves):
+                if leaf_values is not None:
+                    mm = leaf_values[i]
+                else:
+                    pos.apply(move)
+                    mm, _ = minimax(pos, depth - 1, h, stats)
+                    pos.undo()
                 if mm < best_value:
                     best_value = mm
                     best_move = move
@@ -0,0 +1,115 @@
+import chess
+from kbnk import BB, KING_ATTACKS, KNIGHT_ATTACKS, bishop_attacks
+
+MAX_PLY = 64
+
+
+def white_move_effects(squares, move):
+    ''' Returns (gain, check) for a white move: how many more squares around the
+        black king the moving piece attacks after the move than before it, and
+        whether the move gives check.
+
+        squares -- (white king, black king, white bishop, white knight) before the move
+        move -- a white move
+    '''
+    wk, bk, wb, wn = squares
+    frm = move.from_square
+    to = move.to_square
+    ring = KING_ATTACKS[bk]
+    occupied = BB[wk] | BB[bk] | BB[wb] | BB[wn]
+    moved = (occupied & ~BB[frm]) | BB[to]
+
+    if frm == wn:
+        before = KNIGHT_ATTACKS[wn]
+        after = KNIGHT_ATTACKS[to]
+        wn = to
+    elif frm == wk:
+        before = KING_ATTACKS[wk]
+        after = KING_ATTACKS[to]
+        wk = to
+    else:
+        before = bishop_attacks(wb, occupied)
+        after = bishop_attacks(to, moved)
+        wb = to
+
+    gain = chess.popcount(after & ring) - chess.popcount(before & ring)
+    check = bool(KNIGHT_ATTACKS[wn] & BB[bk] or bishop_attacks(wb, moved) & BB[bk])
+    return gain, check
+
+
+class MoveOrdering:
+    ''' Move ordering for alphabeta: hash/PV move first, then checks and moves that
+        take squares from the black king, then killer moves for the ply, then the
+        history heuristic.  Also counts how many cutoffs came from the first move
+        searched.
+    '''
+    def __init__(self):
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = [0] * (64 * 64)
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+
+    def new_search(self):
+        ''' Prepares for a new root search: forgets killers and ages the history scores.
+        '''
+        for killers in self.killers:
+            killers[0] = killers[1] = None
+        self.history = [v // 2 for v in self.history]
+
+
+    def order(self, pos, moves, ply, hash_move=None):
+        ''' Returns moves sorted best-first.
+
+            pos -- the position the moves are played from
+            moves -- the legal moves of pos
+            ply -- distance from the root
+            hash_move -- best move from an earlier search of pos, if any
+        '''
+        white = pos.actor() == 0
+        squares = pos.squares()
+        killers = self.killers[ply] if ply < MAX_PLY else (None, None)
+        history = self.history
+
+        def key(move):
+            if move == hash_move:
+                return (3, 0)
+            if white:
+                gain, check = white_move_effects(squares, move)
+                if check or gain > 0:
+                    return (2, 8 * check + gain)
+            if move == killers[0]:
+                return (1, 1)
+            if move == killers[1]:
+                return (1, 0)
+            return (0, history[move.from_square * 64 + move.to_square])
+
+        return sorted(moves, key=key, reverse=True)
+
+
+    def cutoff(self, move, index, depth, ply):
+        ''' Records that move caused a cutoff.
+
+            move -- the refuting move
+            index -- its position in the ordered move list
+            depth -- remaining depth at the node
+            ply -- distance from the root
+        '''
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if move != killers[0]:
+                killers[1] = killers[0]
+                killers[0] = move
+        self.history[move.from_square * 64 + move.to_square] += depth * depth
+
+
+    def first_move_cutoff_rate(self):
+        ''' Returns the fraction of cutoffs produced by the first move searched.
+        '''
+        if self.cutoffs == 0:
+            return 0.0
+        return self.first_move_cutoffs / self.cutoffs
@@ -0,0 +1,223 @@
+import itertools
+import math
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from alphabeta import alphabeta, move_rank, principal_variation, table_key
+from minimax import Heuristic
+from ordering import MoveOrdering
+from symmetry import transform_move
+from transposition import EXACT, TranspositionTable
+
+# one pool per worker count, shared by every policy in this process
+_pools = {}
+
+# per worker process: (heuristic, batch, tt_mb, symmetric) -> (Heuristic, table, ordering),
+# for the session that last submitted a task
+_searchers = {}
+_session = None
+
+# session numbers handed out by this process
+_sessions = itertools.count()
+
+
+def new_session():
+    ''' Returns a new session number.  Workers keep their heuristics, tables and
+        orderings between the tasks of a session and start afresh in a new one, so a
+        policy that takes one when it is created doesn't inherit the state of earlier
+        policies (and matches) that used the same pool.
+    '''
+    return next(_sessions)
+
+
+def get_pool(threads):
+    if threads not in _pools:
+        _pools[threads] = ProcessPoolExecutor(max_workers=threads)
+    return _pools[threads]
+
+
+def _search_move(pos, move, depth, alpha, beta, heuristic, batch, tt_mb, symmetric, session):
+    # runs in a worker: searches the subtree below one root move with the worker's
+    # own heuristic, table and ordering, which persist between the session's tasks
+    global _session
+    if session != _session:
+        _searchers.clear()
+        _session = session
+    settings = (heuristic, batch, tt_mb, symmetric)
+    if settings not in _searchers:
+        tt = TranspositionTable(tt_mb, symmetric) if tt_mb > 0 else None
+        _searchers[settings] = (Heuristic(heuristic, batch), tt, MoveOrdering())
+    h, tt, ordering = _searchers[settings]
+
+    calls = h.calls
+    rep_scores = tt.rep_scores if tt is not None else 0
+    cutoffs = ordering.cutoffs
+    first_move_cutoffs = ordering.first_move_cutoffs
+    ordering.new_search()
+
+    pos.apply(move)
+    value, _ = alphabeta(pos, depth - 1, h, alpha, beta, tt, 1, ordering)
+    pv = principal_variation(pos, tt, depth - 1) if tt is not None else []
+    pos.undo()
+
+    return {
+        "value": value,
+        "pv": pv,
+        "calls": h.calls - calls,
+        "rep_scores": (tt.rep_scores if tt is not None else 0) - rep_scores,
+        "cutoffs": ordering.cutoffs - cutoffs,
+        "first_move_cutoffs": ordering.first_move_cutoffs - first_move_cutoffs,
+    }
+
+
+def parallel_alphabeta(pos, depth, h, threads, tt=None, ordering=None, session=None, pv=None):
+    ''' Returns the (value, move) alphabeta(pos, depth, h, -h.inf, h.inf, tt, ordering=ordering, pv=pv)
+        would, splitting the root moves among worker processes.
+
+        The first move in the root ordering is searched here with a full window.
+        Every later move goes to a worker with the best value found so far among
+        the moves before it as its bound.  Values beyond the bound are exact, and a
+        move that would win a tie (one ranked before the best move by
+        alphabeta.move_rank) gets a bound just short of the best value, so ties
+        resolve to the same move as in the serial search whichever order moves
+        finish in.
+        Workers keep their own tables, so the root's table and ordering see only the
+        first move's subtree, plus the worker's principal variation below the best
+        move, which the next search's PV comes from.
+
+        pos -- a game position
+        depth -- a nonnegative integer
+        h -- a Heuristic
+        threads -- number of worker processes
+        tt -- a TranspositionTable, or None
+        ordering -- a MoveOrdering, or None
+        session -- a new_session number shared by the searches whose workers may keep
+                   their tables and orderings between them
+        pv -- the expected line from pos, whose first move is searched first, or None
+    '''
+    count = pos.history.get(pos.key, 0)
+    moves = pos.get_actions()
+    if depth <= 1 or count >= 2 or pos.is_terminal() or len(moves) < 2:
+        # nothing worth splitting
+        return alphabeta(pos, depth, h, -h.inf, h.inf, tt, ordering=ordering, pv=pv)
+
+    pv_move = pv[0] if pv else None
+    hash_move = None
+    if tt is not None:
+        key, symmetry = table_key(pos, tt)
+        entry = tt.probe(key)
+        if entry is not None:
+            hash_move = transform_move(entry[3], symmetry)
+        rep_scores = tt.rep_scores
+    if pv_move is not None:
+        hash_move = pv_move
+    if ordering is not None:
+        moves = ordering.order(pos, moves, 0, hash_move)
+    elif hash_move is not None and hash_move in moves:
+        moves = [hash_move] + [move for move in moves if move != hash_move]
+
+    ranks = {move: move_rank(pos, move, pv_move) for move in moves}
+    maximizing = pos.actor() == 0
+    better = (lambda a, b: a > b) if maximizing else (lambda a, b: a < b)
+
+    pos.apply(moves[0])
+    try:
+        child_pv = pv if moves[0] == pv_move else None
+        best_value, _ = alphabeta(pos, depth - 1, h, -h.inf, h.inf, tt, 1, ordering, pv=child_pv)
+    finally:
+        pos.undo()
+    best_index = 0
+    best_pv = None
+    reps = 0
+
+    # submit moves in order, so every running task's bound comes from earlier moves only
+    pool = get_pool(threads)
+    tt_mb = tt.size_mb if tt is not None else 0
+    symmetric = tt.symmetric if tt is not None else False
+    pending = {}
+    next_index = 1
+    while next_index < len(moves) or pending:
+        while next_index < len(moves) and len(pending) < threads:
+            bound = best_value
+            if ranks[moves[next_index]] < ranks[moves[best_index]]:
+                bound = math.nextafter(best_value, -h.inf if maximizing else h.inf)
+            alpha, beta = (bound, h.inf) if maximizing else (-h.inf, bound)
+            future = pool.submit(_search_move, pos, moves[next_index], depth, alpha, beta,
+                                 h.heuristic, h.batch, tt_mb, symmetric, session)
+            pending[future] = next_index
+            next_index += 1
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            index = pending.pop(future)
+            result = future.result()
+            h.calls += result["calls"]
+            reps += result["rep_scores"]
+            if ordering is not None:
+                ordering.cutoffs += result["cutoffs"]
+                ordering.first_move_cutoffs += result["first_move_cutoffs"]
+
+            # moves finish out of order; an equal value only wins for a move ranked
+            # before the best, as in alphabeta
+            value = result["value"]
+            if better(value, best_value) or (value == best_value and ranks[moves[index]] < ranks[moves[best_index]]):
+                best_value, best_index, best_pv = value, index, result["pv"]
+
+    if tt is not None:
+        best_move = transform_move(moves[best_index], symmetry)
+        if reps == 0 and tt.rep_scores == rep_scores:
+            tt.store(key, best_value, depth, EXACT, best_move)
+        else:
+            tt.store_move(key, best_value, EXACT, best_move)
+        if best_pv is not None:
+            store_line(pos, [moves[best_index]] + best_pv, best_value, tt)
+    return best_value, moves[best_index]
+
+
+def store_line(pos, line, value, tt):
+    # keeps the moves of a line from pos that a worker found, as the serial search
+    # would have left them in tt, without a value any probe can cut on
+    for ply, move in enumerate(line):
+        pos.apply(move)
+        if ply + 1 < len(line):
+            key, symmetry = table_key(pos, tt)
+            tt.store_move(key, value, EXACT, transform_move(line[ply + 1], symmetry))
+    for _ in line:
+        pos.undo()
+
+
+if __name__ == "__main__":
+    # speedup against worker count on the starting positions of the standard seeds
+    import argparse
+    import os
+    import time
+    from chess_bnk import ChessBNKGame
+    from kbnk import KBNKState
+    from scoring import evaluate
+
+    parser = argparse.ArgumentParser(description="Benchmark root-parallel AlphaBeta.")
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--positions", type=int, default=10)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    roots = [KBNKState.from_state(ChessBNKGame(args.seed + i).initial_state()) for i in range(args.positions)]
+    print(f"{os.cpu_count()} cpus, depth {args.depth}, {len(roots)} positions")
+
+    serial = None
+    for threads in args.threads:
+        results = []
+        t0 = time.perf_counter()
+        for pos in roots:
+            h = Heuristic(evaluate)
+            tt = TranspositionTable(16)
+            if threads == 1:
+                results.append(alphabeta(pos, args.depth, h, -h.inf, h.inf, tt, ordering=MoveOrdering()))
+            else:
+                results.append(parallel_alphabeta(pos, args.depth, h, threads, tt, MoveOrdering()))
+        elapsed = time.perf_counter() - t0
+        if serial is None:
+            serial = (elapsed, results)
+        same = sum(a == b for a, b in zip(results, serial[1]))
+        print(f"{threads} threads: {elapsed:.2f}s, speedup {serial[0] / elapsed:.2f}x, "
+              f"same move and value on {same}/{len(roots)}")
@@ -1,4 +1,4 @@
-from chess_bnk import ChessBNKGame
+from chess_bnk import ChessBNKGame, ChessBNKState
 
 def play_game(
     p0,
@@ -6,10 +6,20 @@ def play_game(
     seed=0, 
     max_moves=100, 
     vizualize=True,
-    progress=None
+    progress=None,
+    accuracy=None,
+    ponder=False,
+    start=None
 ):
-    game = ChessBNKGame(seed=seed)
-    position = game.initial_state()
+    # accuracy -- optional tablebase.DTMAccuracy that scores every White move
+    # ponder -- let p0 search Black's expected reply while p1 chooses, if it can
+    # start -- optional chess.Board to start from instead of a position drawn from seed
+    ponder = ponder and hasattr(p0, "ponder")
+    if start is not None:
+        position = ChessBNKState(start.copy())
+    else:
+        game = ChessBNKGame(seed=seed)
+        position = game.initial_state()
     
     if vizualize:
         print("Initial Position:")
@@ -26,9 +36,13 @@ def play_game(
             move = p1(position)
         if move is None:
             raise RuntimeError(f"Policy returned None move")
+        if accuracy is not None and actor == 0:
+            accuracy.record(position, move)
         position = position.successor(move)
         b = position.board
         move_count += 1
+        if ponder and actor == 0 and not position.is_terminal():
+            p0.ponder(position)
 
         if vizualize:
             print(f"Move {move_count}: {color} played {move}")
@@ -36,25 +50,23 @@ def play_game(
                 print(f"Wins: {progress[0]}/{progress[2]}, Draws: {progress[1]}/{progress[2]}")
             print(b)
             print()
-        
+
+    if ponder:
+        p0.stop_pondering()
+
     reason = None
     if position.is_terminal():
-        if position.payoff() == 1.0:
-            reason = "checkmate"
+        reason = position.terminal_reason()
+        if reason == "checkmate":
             print("White wins in {} moves!".format(move_count))
-        else:
-            if b.is_stalemate():
-                reason = "stalemate"
-                print("Draw by stalemate in {} moves.".format(move_count))
-            elif b.is_insufficient_material():
-                reason = "insufficient_material"
-                print("Draw by insufficient material in {} moves.".format(move_count))
-            elif b.can_claim_fifty_moves() or b.is_fifty_moves():
-                reason = "fifty_move_rule"
-                print("Draw by fifty-move rule in {} moves.".format(move_count))
-            elif b.can_claim_threefold_repetition():
-                reason = "threefold_repetition"
-                print("Draw by threefold repetition in {} moves.".format(move_count))
+        elif reason == "stalemate":
+            print("Draw by stalemate in {} moves.".format(move_count))
+        elif reason == "insufficient_material":
+            print("Draw by insufficient material in {} moves.".format(move_count))
+        elif reason == "fifty_move_rule":
+            print("Draw by fifty-move rule in {} moves.".format(move_count))
+        elif reason == "threefold_repetition":
+            print("Draw by threefold repetition in {} moves.".format(move_count))
     elif move_count >= max_moves: 
         reason = "move_limit"
         print("Draw by maximum move limit of {}.".format(max_moves))
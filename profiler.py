@@ -0,0 +1,109 @@
+import os
+import sys
+import threading
+
+# seconds between samples
+INTERVAL = 0.005
+
+
+def frame_label(frame):
+    ''' Returns "module:function" for a frame, e.g. "scoring:evaluate" or
+        "chess:Board.generate_legal_moves".
+    '''
+    code = frame.f_code
+    # co_qualname (with the class) is new in Python 3.11
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+class SamplingProfiler:
+    ''' A statistical profiler: a background thread records the stacks of the
+        thread that started it, and of threads started since, each interval seconds.
+        Stacks are counted in collapsed form (root first, frames joined by ";"), the
+        input format of flame graph tools such as flamegraph.pl and speedscope.
+        Threads blocked in the threading module (joining or waiting) are idle and
+        not counted.
+    '''
+    def __init__(self, interval=INTERVAL, root=None):
+        ''' Creates a profiler that is not yet sampling.
+
+            interval -- seconds between samples
+            root -- a function; stacks through it start there, leaving out the frames
+                    of whatever called it (None to keep whole stacks)
+        '''
+        self.interval = interval
+        self.root = root.__code__ if root is not None else None
+        self.stacks = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._ignore = set()
+
+
+    def start(self):
+        # threads already running (such as a process pool's) are not ours to sample
+        self._ignore = set(sys._current_frames()) - {threading.get_ident()}
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+
+    def _run(self):
+        ignore = self._ignore | {threading.get_ident()}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident in ignore or frame.f_globals.get("__name__") == "threading":
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(frame_label(frame))
+                    if frame.f_code is self.root:
+                        break
+                    frame = frame.f_back
+                stack = ";".join(reversed(labels))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
+                self.samples += 1
+
+
+def write_collapsed(stacks, path):
+    ''' Writes stack counts to path, one "frame;frame;... count" line per stack.
+    '''
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        for stack, count in sorted(stacks.items()):
+            f.write(f"{stack} {count}\n")
+
+
+def hot_functions(stacks):
+    ''' Returns {function: (self samples, total samples)} for stack counts, where
+        self counts samples in the function itself and total those with it
+        anywhere on the stack (once per sample, however deep the recursion).
+    '''
+    functions = {}
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        for label in set(frames):
+            own, total = functions.get(label, (0, 0))
+            functions[label] = (own, total + count)
+        own, total = functions[frames[-1]]
+        functions[frames[-1]] = (own + count, total)
+    return functions
+
+
+def format_hot_functions(stacks, top=15):
+    ''' Returns a table of the top functions by self samples.
+    '''
+    samples = sum(stacks.values())
+    if not samples:
+        return "no samples"
+    functions = hot_functions(stacks)
+    lines = [f"{'self':>7} {'total':>7}  function ({samples} samples)"]
+    ranked = sorted(functions.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    for label, (own, total) in ranked:
+        lines.append(f"{own / samples * 100:6.1f}% {total / samples * 100:6.1f}%  {label}")
+    return "\n".join(lines)
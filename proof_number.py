@@ -0,0 +1,180 @@
+from scoring import CORNER_DISTANCE, SQUARE_COLOR
+
+INF = float("inf")
+
+# default limits for proof_number_policy
+NODE_BUDGET = 5000
+MAX_PLIES = 21
+# largest distance of the black king from a corner of the bishop's colour, the
+# only corners it can be mated in, to try proving at
+MAX_CORNER_DISTANCE = 1
+# White moves to play without trying again after a failed proof
+RETRY_AFTER = 4
+# plies the mate limit grows by between passes
+PLY_STEP = 8
+
+
+class Node:
+    ''' A node of the proof-number tree: the position reached by move from its
+        parent.  White nodes are OR nodes (one mating move proves them), black
+        nodes AND nodes (every reply must be mated).
+    '''
+    __slots__ = ("move", "key", "white", "ply", "pn", "dn", "children")
+
+    def __init__(self, move, key, white, ply):
+        self.move = move
+        self.key = key
+        self.white = white
+        self.ply = ply
+        self.pn = 1
+        self.dn = 1
+        self.children = None
+
+
+class ProofNumberSolver:
+    ''' Proof-number search for a forced mate by White.  Proves or disproves that
+        White can mate within max_plies of the root, creating at most budget nodes
+        per call to solve.  Counts solves, proofs and nodes.
+
+        The limit on plies is raised in steps of PLY_STEP up to max_plies, so short
+        mates are found (and played) before the search wanders down long lines.
+    '''
+    def __init__(self, budget=NODE_BUDGET, max_plies=MAX_PLIES):
+        ''' budget -- most nodes to create per call to solve
+            max_plies -- positions this many plies below the root count as not mated
+        '''
+        self.budget = budget
+        self.max_plies = max_plies
+        self.solves = 0
+        self.proofs = 0
+        self.nodes = 0
+
+
+    def _set_numbers(self, node, pos, limit):
+        # initial numbers for a new node at pos
+        if pos.is_terminal():
+            node.pn, node.dn = (0, INF) if pos.payoff() > 0 else (INF, 0)
+        elif node.ply >= limit:
+            node.pn, node.dn = INF, 0
+        elif node.white:
+            # disproving needs every white move refuted
+            node.pn, node.dn = 1, len(pos.get_actions())
+        else:
+            # proving needs every black move mated
+            node.pn, node.dn = len(pos.get_actions()), 1
+
+
+    def _expand(self, node, pos, limit):
+        node.children = []
+        for move in pos.get_actions():
+            pos.apply(move)
+            child = Node(move, pos.key, not node.white, node.ply + 1)
+            self._set_numbers(child, pos, limit)
+            pos.undo()
+            node.children.append(child)
+        self.nodes += len(node.children)
+        self._update(node)
+
+
+    def _update(self, node):
+        if node.white:
+            node.pn = min(child.pn for child in node.children)
+            node.dn = sum(child.dn for child in node.children)
+        else:
+            node.pn = sum(child.pn for child in node.children)
+            node.dn = min(child.dn for child in node.children)
+
+
+    def solve(self, pos):
+        ''' Searches pos, a White-to-move position, and returns its root node: proven
+            if root.pn == 0, disproven if root.dn == 0, and otherwise undecided
+            when the budget ran out.
+
+            pos -- a game position with apply and undo
+        '''
+        self.solves += 1
+        start = self.nodes
+        for limit in list(range(5, self.max_plies, PLY_STEP)) + [self.max_plies]:
+            root = Node(None, pos.key, True, 0)
+            self._set_numbers(root, pos, limit)
+
+            while root.pn != 0 and root.dn != 0 and self.nodes - start < self.budget:
+                # walk down to the most-proving node
+                path = [root]
+                node = root
+                while node.children is not None:
+                    if node.white:
+                        node = min(node.children, key=lambda child: child.pn)
+                    else:
+                        node = min(node.children, key=lambda child: child.dn)
+                    pos.apply(node.move)
+                    path.append(node)
+
+                self._expand(node, pos, limit)
+
+                # back up the new numbers to the root
+                for node in reversed(path[:-1]):
+                    pos.undo()
+                    self._update(node)
+
+            if root.pn == 0:
+                self.proofs += 1
+                break
+            if root.dn != 0:
+                # out of budget
+                break
+        return root
+
+
+    def stats(self):
+        return {"solves": self.solves, "proofs": self.proofs, "nodes": self.nodes}
+
+
+def mating_move(root):
+    ''' Returns the child of a proven White node that keeps the proof.
+    '''
+    return next(child for child in root.children if child.pn == 0)
+
+
+def proof_number_policy(policy, solver=None, corner=MAX_CORNER_DISTANCE, retry=RETRY_AFTER):
+    ''' Wraps a White policy: when the black king is within corner squares (king
+        moves) of a corner of the bishop's colour, tries to prove a forced mate first
+        and plays the proven line, and otherwise (or if no proof is found) plays what
+        policy would.  After a failed proof it plays retry moves before trying again.
+
+        policy -- the fallback policy
+        solver -- a ProofNumberSolver, or None for one with the default limits
+        corner -- largest scoring.distance_to_target_corner of the black king to try
+                  proving at
+        retry -- White moves to leave between a failed proof and the next try
+    '''
+    if solver is None:
+        solver = ProofNumberSolver()
+    # the proof subtree left after the move last played from a proof
+    line = {"node": None, "wait": 0}
+
+    def fxn(pos):
+        node = line["node"]
+        line["node"] = None
+        if node is not None:
+            # follow black's reply into the proof, which covers every reply
+            node = next((child for child in node.children if child.key == pos.key), None)
+
+        if node is None:
+            _, bk, wb, _ = pos.squares()
+            if wb is None or CORNER_DISTANCE[SQUARE_COLOR[wb]][bk] > corner:
+                return policy(pos)
+            if line["wait"] > 0:
+                line["wait"] -= 1
+                return policy(pos)
+            node = solver.solve(pos)
+            if node.pn != 0:
+                line["wait"] = retry
+                return policy(pos)
+
+        child = mating_move(node)
+        line["node"] = child
+        return child.move
+    fxn.__dict__.update(policy.__dict__)
+    fxn.solver = solver
+    return fxn
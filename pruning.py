@@ -0,0 +1,117 @@
+from ordering import white_move_effects
+
+# moves searched at full depth at each node before late ones are reduced
+LMR_MOVES = 3
+# plies a late move is reduced by: evaluate scores black-to-move positions lower
+# (it counts black king mobility only then), so a one-ply reduction ends on the
+# other side's turn and looks better than it is
+LMR_REDUCTION = 2
+# nodes with less remaining depth are never reduced
+LMR_MIN_DEPTH = 4
+
+# most a quiet white move can raise evaluate: a bishop move shortens two of the
+# three distances between the white pieces by up to 14 each (0.1 * 28 / 42)
+FUTILITY_MARGIN = 0.07
+
+
+class Pruning:
+    ''' Switches and counters for the selective parts of alphabeta.
+
+        Late-move reductions search moves ordered after the first LMR_MOVES
+        LMR_REDUCTION plies shallower, and again at full depth if the shallow result
+        would raise the window.  Checks, moves that take squares from the black king and black
+        captures are never reduced.
+
+        Futility pruning skips quiet (non-checking) white moves at depth-1 nodes
+        whose static value plus FUTILITY_MARGIN can't reach alpha.  Only white
+        moves are pruned: a black move can capture or repeat a position, which
+        the margin can't bound.
+    '''
+    def __init__(self, lmr=False, futility=False):
+        self.lmr = lmr
+        self.futility = futility
+        self.reductions = 0
+        self.researches = 0
+        self.futility_prunes = 0
+
+
+    def reduction(self, pos, move, index, depth):
+        ''' Returns how many plies shallower than normal to search move first.
+
+            pos -- the position move is played from
+            move -- a legal move
+            index -- move's place in the search order
+            depth -- remaining depth at pos
+        '''
+        if not self.lmr or index < LMR_MOVES or depth < LMR_MIN_DEPTH:
+            return 0
+        if pos.actor() == 0:
+            gain, check = white_move_effects(pos.squares(), move)
+            if check or gain > 0:
+                return 0
+        elif move.to_square in pos.squares()[2:]:
+            return 0
+        self.reductions += 1
+        return LMR_REDUCTION
+
+
+    def futile(self, pos, depth, alpha, h):
+        ''' Returns the bound to give pruned moves if the quiet moves of pos can't
+            reach alpha, or None.
+        '''
+        if not self.futility or depth != 1 or pos.actor() != 0:
+            return None
+        bound = h.evaluate(pos) + FUTILITY_MARGIN
+        return bound if bound <= alpha else None
+
+
+    def quiet(self, pos, move):
+        ''' Determines if a white move doesn't give check.
+        '''
+        return not white_move_effects(pos.squares(), move)[1]
+
+
+    def stats(self):
+        return {"reductions": self.reductions, "researches": self.researches,
+                "futility_prunes": self.futility_prunes}
+
+
+if __name__ == "__main__":
+    # measurement mode: heuristic calls, win rate and game length against the
+    # greedy defender, with each switch on its own and both, against plain search
+    import argparse
+    import contextlib
+    import io
+    import time
+    from play_game import play_game
+    from run_matches import make_policy
+
+    parser = argparse.ArgumentParser(description="Measure late-move reductions and futility pruning.")
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument("--matches", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-moves", type=int, default=100)
+    args = parser.parse_args()
+
+    configs = [(args.depth - 1, False, False), (args.depth, False, False), (args.depth, True, False),
+               (args.depth, False, True), (args.depth, True, True)]
+    baseline = None
+    for depth, lmr, futility in configs:
+        calls = wins = moves = 0
+        t0 = time.perf_counter()
+        for i in range(args.matches):
+            white, _ = make_policy("alphabeta", depth, native=True, lmr=lmr, futility=futility)
+            black, _ = make_policy("greedy_defender", depth)
+            with contextlib.redirect_stdout(io.StringIO()):
+                payoff, _, move_count = play_game(white, black, seed=args.seed + i, max_moves=args.max_moves,
+                                                  vizualize=False)
+            calls += white.h.calls
+            wins += payoff == 1.0
+            moves += move_count
+        elapsed = time.perf_counter() - t0
+        if depth == args.depth and not lmr and not futility:
+            baseline = calls
+        label = f"depth {depth}" + (" +lmr" if lmr else "") + (" +futility" if futility else "")
+        saved = f", {(1 - calls / baseline) * 100:.1f}% fewer calls than depth {args.depth}" if baseline and calls != baseline else ""
+        print(f"{label}: {calls} heuristic calls{saved}, wins {wins}/{args.matches}, "
+              f"average {moves / args.matches:.1f} moves, {elapsed:.1f}s")
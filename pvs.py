@@ -0,0 +1,122 @@
+import math
+import time
+
+from alphabeta import alphabeta_policy, enter_node, store_node
+
+# half-width of the aspiration window around the previous iteration's value; a
+# quiet move changes evaluate by a few hundredths
+ASPIRATION_WINDOW = 0.05
+
+
+def pvs_policy(depth, h, tt=None, ordering=None, movetime=None, game_time=None, stats=None):
+    ''' Returns a policy like alphabeta_policy's that searches with pvs, and with
+        aspiration windows when it deepens iteratively under a time control.
+    '''
+    return alphabeta_policy(depth, h, tt, ordering, movetime, game_time,
+                            search=pvs, window=ASPIRATION_WINDOW, stats=stats)
+
+
+def pvs(pos, depth, h, alpha, beta, tt=None, ply=0, ordering=None, deadline=None, pv=None, stats=None):
+    ''' Principal variation search: returns what alphabeta would (the same value
+        within the window, a bound outside it) but searches only the first move at
+        each node with the full window.  The rest get a null window just above alpha
+        (below beta at min nodes), which only proves them no better, and are searched
+        again with the full window if they are.
+
+        Arguments are alphabeta's.
+    '''
+    result, hash_move, node = enter_node(pos, depth, h, alpha, beta, tt, ply, deadline, stats)
+    if result is not None:
+        return result
+
+    pv_move = pv[ply] if pv is not None and ply < len(pv) else None
+    if pv_move is not None:
+        hash_move = pv_move
+
+    moves = pos.get_actions()
+    if ordering is not None:
+        moves = ordering.order(pos, moves, ply, hash_move)
+    elif hash_move is not None and hash_move in moves:
+        moves = [hash_move] + [move for move in moves if move != hash_move]
+
+    maximizing = pos.actor() == 0
+    best = -h.inf if maximizing else h.inf
+    best_move = None
+    for i, move in enumerate(moves):
+        child_pv = pv if move == pv_move else None
+        pos.apply(move)
+        try:
+            if i == 0:
+                mm, _ = pvs(pos, depth - 1, h, alpha, beta, tt, ply + 1, ordering, deadline, child_pv, stats)
+            else:
+                # an empty window (alpha == beta) would cut off after any move, so the
+                # null window is one float wide
+                if maximizing:
+                    null = (alpha, math.nextafter(alpha, h.inf))
+                else:
+                    null = (math.nextafter(beta, -h.inf), beta)
+                mm, _ = pvs(pos, depth - 1, h, *null, tt, ply + 1, ordering, deadline, child_pv, stats)
+                if alpha < mm < beta:
+                    mm, _ = pvs(pos, depth - 1, h, alpha, beta, tt, ply + 1, ordering, deadline, child_pv, stats)
+        finally:
+            pos.undo()
+
+        if maximizing:
+            if mm > best:
+                best = mm
+                best_move = move
+            alpha = max(alpha, best)
+        else:
+            if mm < best:
+                best = mm
+                best_move = move
+            beta = min(beta, best)
+        if alpha >= beta:
+            if ordering is not None:
+                ordering.cutoff(move, i, depth, ply)
+            if stats is not None:
+                stats.cutoff(i)
+            break
+
+    store_node(tt, node, best, best_move, depth, ply)
+    return best, best_move
+
+
+if __name__ == "__main__":
+    # heuristic calls and time of pvs against alphabeta on the standard seeds, at a
+    # fixed depth and deepening iteratively to it
+    import argparse
+    from alphabeta import alphabeta, iterative_deepening
+    from chess_bnk import ChessBNKGame
+    from kbnk import KBNKState
+    from minimax import Heuristic
+    from ordering import MoveOrdering
+    from scoring import evaluate
+    from transposition import TranspositionTable
+
+    parser = argparse.ArgumentParser(description="Compare PVS with AlphaBeta at equal depth.")
+    parser.add_argument("--depths", type=int, nargs="+", default=[3, 4, 5])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--positions", type=int, default=10)
+    args = parser.parse_args()
+
+    roots = [KBNKState.from_state(ChessBNKGame(args.seed + i).initial_state()) for i in range(args.positions)]
+    for depth in args.depths:
+        line = []
+        results = {}
+        for name, search, deepen, window in (("alphabeta", alphabeta, False, None), ("pvs", pvs, False, None),
+                                             ("alphabeta ID", alphabeta, True, None),
+                                             ("pvs ID+aspiration", pvs, True, ASPIRATION_WINDOW)):
+            h = Heuristic(evaluate)
+            t0 = time.perf_counter()
+            results[name] = []
+            for pos in roots:
+                tt = TranspositionTable(16)
+                if deepen:
+                    result = iterative_deepening(pos, depth, h, float("inf"), tt, MoveOrdering(), search, window)
+                else:
+                    result = search(pos, depth, h, -h.inf, h.inf, tt, ordering=MoveOrdering())
+                results[name].append(result)
+            line.append(f"{name} {h.calls} calls {time.perf_counter() - t0:.2f}s")
+        same = sum(a == b for a, b in zip(results["alphabeta"], results["pvs"]))
+        print(f"depth {depth}: " + ", ".join(line) + f"; pvs same (value, move) on {same}/{len(roots)}")
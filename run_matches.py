@@ -1,34 +1,133 @@
 import argparse
+import contextlib
+import io
+import os
 import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from agents import random_policy, greedy_policy
 from minimax import Heuristic, minimax_policy
 from alphabeta import alphabeta_policy
-from scoring import evaluate
-from defender_scoring import defender_eval
+from pvs import pvs_policy
+from transposition import TranspositionTable
+from ordering import MoveOrdering
+from pruning import Pruning
+from proof_number import ProofNumberSolver, proof_number_policy
+from kbnk import KBNKState, native_policy
+from scoring import ScoredKBNKState, evaluate, evaluate_incremental
+from defender_scoring import defender_eval, score_king_moves
+from symmetry import canonical_key
+from search_stats import SearchStats, format_summary, stats_policy, summarize
+from profiler import SamplingProfiler, format_hot_functions, write_collapsed
 
 from play_game import play_game
 
 
-def make_policy(policy: str, depth: int):
+def make_policy(policy: str, depth: int, tt_mb: float = 16, movetime: float = None, game_time: float = None, native: bool = False, seed: int = None, tb_path: str = None, batch_eval: bool = False, incremental: bool = False, eval_cache: int = 0, symmetric: bool = False, threads: int = 1, lmr: bool = False, futility: bool = False, pn_budget: int = 0, search_stats: bool = False):
 
     # BLACK POLICIES
     if policy == "random":
-        return random_policy(), "Random Agent"
+        return random_policy(seed), "Random Agent"
     
     if policy == "greedy_defender":
-        return greedy_policy(defender_eval), "Greedy Defender"
+        return greedy_policy(defender_eval, score_king_moves), "Greedy Defender"
 
-    # WHITE POLICIES
-    if policy == "minimax":
-        h = Heuristic(evaluate)
-        return minimax_policy(depth, h), f"Minimax at depth={depth}"
+    # tablebase agents need numpy and a generated table (python tablebase.py)
+    if policy in ("tablebase", "tablebase_defender"):
+        import tablebase
+        tb = tablebase.Tablebase(tb_path or tablebase.DEFAULT_PATH)
+        if policy == "tablebase":
+            return tablebase.tablebase_policy(tb), "Tablebase"
+        return tablebase.tablebase_defender_policy(tb), "Tablebase Defender"
 
-    if policy == "alphabeta":
-        h = Heuristic(evaluate)
-        return alphabeta_policy(depth, h), f"AlphaBeta at depth={depth}"
+    # WHITE POLICIES
+    # native engines search on KBNKState instead of chess.Board; incremental
+    # evaluation needs the subclass that carries the evaluation terms
+    heuristic = evaluate
+    wrap = native_policy if native else (lambda p: p)
+    if incremental:
+        heuristic = evaluate_incremental
+        wrap = lambda p: native_policy(p, ScoredKBNKState)
+
+    # per-move search counters, with move generation, apply/undo and evaluation
+    # timed on an instrumented state and heuristic
+    stats = SearchStats() if search_stats else None
+    if stats is not None:
+        state = ScoredKBNKState if incremental else KBNKState if native else None
+        heuristic = stats.timed(heuristic)
+        wrap = lambda p: stats_policy(p, stats, state)
+
+    # a proof-number mate solver goes in front of the search near the edge, on
+    # the same state as the search
+    if pn_budget:
+        solve = lambda p: proof_number_policy(p, ProofNumberSolver(pn_budget))
+    else:
+        solve = lambda p: p
+
+    # symmetric caches share entries between positions related by a board symmetry
+    cache_key = (lambda pos: canonical_key(pos)[0]) if symmetric else None
+
+    # batched leaf evaluation needs numpy, and scores leaves with scoring.evaluate
+    # itself, past the eval cache and the incremental terms
+    batch = None
+    if batch_eval:
+        unsupported = [flag for flag, on in (("--incremental-eval", incremental), ("--eval-cache-size", eval_cache))
+                       if on]
+        if unsupported:
+            raise ValueError(f"--batch-eval can't be combined with {', '.join(unsupported)}")
+        from batch_scoring import evaluate_children
+        batch = evaluate_children if stats is None else stats.timed(evaluate_children)
 
-    raise ValueError(f"Unknown policy: {policy}. Please select from: random, greedy_defender, minimax, alphabeta")
+    if policy == "minimax":
+        h = Heuristic(heuristic, batch, eval_cache, cache_key)
+        return wrap(solve(minimax_policy(depth, h, stats))), f"Minimax at depth={depth}"
+
+    if policy in ("alphabeta", "pvs"):
+        h = Heuristic(heuristic, batch, eval_cache, cache_key)
+        tt = TranspositionTable(tt_mb, symmetric) if tt_mb > 0 else None
+        if policy == "alphabeta":
+            name = "AlphaBeta"
+            pruning = Pruning(lmr, futility) if lmr or futility else None
+            policy = wrap(solve(alphabeta_policy(depth, h, tt, MoveOrdering(), movetime, game_time, threads,
+                                                 pruning=pruning, stats=stats)))
+        else:
+            name = "PVS"
+            # pvs neither batches leaves, prunes nor splits the root among processes
+            unsupported = [flag for flag, on in (("--batch-eval", batch_eval), ("--lmr", lmr), ("--futility", futility),
+                                                 ("--search-threads", threads > 1)) if on]
+            if unsupported:
+                raise ValueError(f"PVS does not support {', '.join(unsupported)}")
+            policy = wrap(solve(pvs_policy(depth, h, tt, MoveOrdering(), movetime, game_time, stats)))
+        if movetime is not None or game_time is not None:
+            control = f"movetime={movetime}s" if movetime is not None else f"game-time={game_time}s"
+            if depth is not None:
+                control += f", max depth={depth}"
+            return policy, f"{name} at {control}"
+        return policy, f"{name} at depth={depth}"
+
+    raise ValueError(f"Unknown policy: {policy}. Please select from: random, greedy_defender, tablebase_defender, minimax, alphabeta, pvs, tablebase")
+
+
+def policy_options(args):
+    ''' Returns the make_policy keyword arguments given by the command line flags,
+        which are the same for both sides.
+    '''
+    return {
+        "tt_mb": args.tt_mb,
+        "movetime": args.movetime,
+        "game_time": args.game_time,
+        "native": args.native,
+        "tb_path": args.tablebase,
+        "batch_eval": args.batch_eval,
+        "incremental": args.incremental_eval,
+        "eval_cache": args.eval_cache_size,
+        "symmetric": args.symmetry,
+        "threads": args.search_threads,
+        "lmr": args.lmr,
+        "futility": args.futility,
+        "pn_budget": args.pn_budget,
+        "search_stats": args.stats,
+    }
 
 
 def time_pretty(s: float):
@@ -46,65 +145,229 @@ def time_pretty(s: float):
 
 
 
-def main():
-    parser = argparse.ArgumentParser(description="Run BNK endgame matches between two agents.")
-    parser.add_argument("--matches", type=int, default=1)
-    parser.add_argument("--seed", type=int, default=42)
-    parser.add_argument("--max-moves", type=int, default=100)
-    parser.add_argument("--viz", action="store_true")
-    parser.add_argument("--depth", type=int, default=3, help="Agent depth")
-
-    parser.add_argument("--white", type=str, default="random", help="random | minimax | alphabeta")
-    parser.add_argument("--black", type=str, default="random", help="random | minimax | alphabeta")
-
-    args = parser.parse_args()
-
-    p0, label0 = make_policy(args.white, args.depth)
-    p1, label1 = make_policy(args.black, args.depth)
+def play_match(args, i, progress=None, capture=False):
+    ''' Plays match i with fresh policies, so its result depends only on its seed
+        (args.seed + i) and not on the matches played before it in the same process.
+        Returns a dict of the match's results; "output" holds what the match printed
+        if capture is set.
+    '''
+    KBNKState.cross_check = args.cross_check
+    ScoredKBNKState.check_terms = args.cross_check
+    seed = args.seed + i
+    p0, _ = make_policy(args.white, args.depth, seed=seed, **policy_options(args))
+    p1, _ = make_policy(args.black, args.depth, seed=seed, **policy_options(args))
 
-    total_wins = 0
-    total_draws = 0
-    total_move_count = 0
-    draw_reasons = {}
+    suite = None
+    if args.suite:
+        from start_positions import load_suite
+        suite = load_suite(args.suite)
 
-    match_times = []
-    t0_total = time.perf_counter()
+    accuracy = None
+    if args.dtm_loss:
+        import tablebase
+        accuracy = tablebase.DTMAccuracy(tablebase.Tablebase(args.tablebase or tablebase.DEFAULT_PATH))
 
-    for i in range(args.matches):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out) if capture else contextlib.nullcontext():
         print("======= Match {} =======".format(i + 1))
 
+        profiler = None
+        if args.profile:
+            profiler = SamplingProfiler(root=play_game)
+            profiler.start()
+
         t0_match = time.perf_counter()
         payoff, reason, move_count = play_game(
             p0,
             p1,
-            seed=args.seed + i,
+            seed=seed,
             max_moves=args.max_moves,
             vizualize=args.viz,
-            progress=(total_wins, total_draws, i)
+            progress=progress,
+            accuracy=accuracy,
+            ponder=args.ponder,
+            start=suite[i % len(suite)] if suite else None
         )
         t1_match = time.perf_counter()
 
-        dt_match = t1_match - t0_match
-        match_times.append(dt_match)
+        profile = {}
+        if profiler is not None:
+            profiler.stop()
+            profile = profiler.stacks
+            write_collapsed(profile, os.path.join(args.profile, f"match_{i + 1:03d}.collapsed"))
+
+        search_stats = [dict(record, match=i + 1) for p in (p0, p1) if getattr(p, "stats", None) is not None
+                        for record in p.stats.moves]
+        if search_stats:
+            print("Search stats: " + format_summary(summarize(search_stats)))
+
+    cutoffs = 0
+    first_move_cutoffs = 0
+    calls = 0
+    eval_cache = {}
+    tt_probes = {}
+    pruning = {}
+    proof_number = {}
+    ponder = {}
+    for p in (p0, p1):
+        ordering = getattr(p, "ordering", None)
+        if ordering is not None:
+            cutoffs += ordering.cutoffs
+            first_move_cutoffs += ordering.first_move_cutoffs
+        h = getattr(p, "h", None)
+        if h is not None:
+            calls += h.calls
+        if h is not None and h.cache_size:
+            for key, value in h.cache_stats().items():
+                eval_cache[key] = eval_cache.get(key, 0) + value
+        tt = getattr(p, "tt", None)
+        if tt is not None:
+            tt_probes["hits"] = tt_probes.get("hits", 0) + tt.hits
+            tt_probes["misses"] = tt_probes.get("misses", 0) + tt.misses
+        if getattr(p, "solver", None) is not None:
+            for key, value in p.solver.stats().items():
+                proof_number[key] = proof_number.get(key, 0) + value
+        if getattr(p, "pruning", None) is not None:
+            for key, value in p.pruning.stats().items():
+                pruning[key] = pruning.get(key, 0) + value
+        if args.ponder and getattr(p, "ponder_search", None) is not None:
+            for key, value in p.ponder_search.stats().items():
+                ponder[key] = ponder.get(key, 0) + value
+
+    return {
+        "index": i,
+        "payoff": payoff,
+        "reason": reason,
+        "move_count": move_count,
+        "time": t1_match - t0_match,
+        "cutoffs": cutoffs,
+        "first_move_cutoffs": first_move_cutoffs,
+        "accuracy": accuracy.stats() if accuracy is not None else None,
+        "eval_cache": eval_cache,
+        "tt_probes": tt_probes,
+        "calls": calls,
+        "pruning": pruning,
+        "proof_number": proof_number,
+        "ponder": ponder,
+        "search_stats": search_stats,
+        "profile": profile,
+        "output": out.getvalue(),
+    }
+
 
-        if payoff == 1.0:
+def main():
+    parser = argparse.ArgumentParser(description="Run BNK endgame matches between two agents.")
+    parser.add_argument("--matches", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--max-moves", type=int, default=100)
+    parser.add_argument("--viz", action="store_true")
+    parser.add_argument("--depth", type=int, default=None, help="Agent depth (default 3, or the max depth with a time control)")
+    parser.add_argument("--movetime", type=float, default=None, help="AlphaBeta seconds per move, deepening iteratively")
+    parser.add_argument("--game-time", type=float, default=None, help="AlphaBeta seconds for all of its moves in a game")
+    parser.add_argument("--tt-mb", type=float, default=16, help="AlphaBeta transposition table size in MB (0 disables)")
+    parser.add_argument("--eval-cache-size", type=int, default=0, help="Heuristic values to cache per agent (0 disables)")
+    parser.add_argument("--symmetry", action="store_true", help="Key the transposition table and eval cache by symmetry-canonical position")
+    parser.add_argument("--search-threads", type=int, default=1, help="Worker processes to split each fixed-depth AlphaBeta root among")
+    parser.add_argument("--lmr", action="store_true", help="AlphaBeta late-move reductions")
+    parser.add_argument("--futility", action="store_true", help="AlphaBeta futility pruning at depth-1 nodes")
+    parser.add_argument("--pn-budget", type=int, default=0, help="Nodes for a proof-number mate search near the edge before searching (0 disables)")
+    parser.add_argument("--ponder", action="store_true", help="Let AlphaBeta search Black's expected reply while Black chooses")
+    parser.add_argument("--stats", action="store_true", help="Record per-move search statistics and summarize them per game and run")
+    parser.add_argument("--profile", type=str, default=None, help="Sample each match's stacks, writing flame graph input and a hot function table to this directory")
+    parser.add_argument("--suite", type=str, default=None, help="Start match i from position i of a suite in suites/ (hardest200 | random200)")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes to play matches in")
+
+    parser.add_argument("--native", action="store_true", help="Search on the bitboard KBNK state instead of chess.Board")
+    parser.add_argument("--cross-check", action="store_true", help="With --native, check every node against python-chess (and incremental scores against evaluate)")
+    parser.add_argument("--incremental-eval", action="store_true", help="Search natively, updating the evaluation terms per move")
+    parser.add_argument("--batch-eval", action="store_true", help="Score the children of depth-1 nodes in one NumPy call")
+
+    parser.add_argument("--tablebase", type=str, default=None, help="Tablebase file (default kbnk_dtm.npy)")
+    parser.add_argument("--dtm-loss", action="store_true", help="Score every White move by the distance to mate it loses")
+
+    parser.add_argument("--white", type=str, default="random", help="minimax | alphabeta | pvs | tablebase")
+    parser.add_argument("--black", type=str, default="random", help="random | greedy_defender | tablebase_defender")
+
+    args = parser.parse_args()
+
+    timed = args.movetime is not None or args.game_time is not None
+    if args.depth is None and not timed:
+        args.depth = 3
+
+    try:
+        _, label0 = make_policy(args.white, args.depth, **policy_options(args))
+        _, label1 = make_policy(args.black, args.depth, **policy_options(args))
+    except ValueError as e:
+        parser.error(str(e))
+
+    results = []
+    total_wins = 0
+    total_draws = 0
+    t0_total = time.perf_counter()
+
+    def report(result):
+        nonlocal total_wins, total_draws
+        print(result["output"], end="")
+
+        if result["payoff"] == 1.0:
             total_wins += 1
-        elif payoff == -1.0:
+        elif result["payoff"] == -1.0:
             raise ValueError("Black wins, which should not happen in BNK endgames.")
         else:
-            assert payoff == 0.0
+            assert result["payoff"] == 0.0
             total_draws += 1
-            draw_reasons[reason] = draw_reasons.get(reason, 0) + 1
-
-        total_move_count += move_count
+        results.append(result)
 
         elapsed_total = time.perf_counter() - t0_total
-        avg_time_so_far = elapsed_total / (i + 1)
+        avg_time_so_far = elapsed_total / len(results)
 
-        print(f"Match time: {time_pretty(dt_match)}")
+        print(f"Match time: {time_pretty(result['time'])}")
         print(f"Total time: {time_pretty(elapsed_total)} | Avg/match so far: {time_pretty(avg_time_so_far)}")
         print()
 
+    if args.jobs > 1:
+        # results stream back in the order matches finish
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            futures = [pool.submit(play_match, args, i, None, True) for i in range(args.matches)]
+            for future in as_completed(futures):
+                report(future.result())
+    else:
+        for i in range(args.matches):
+            report(play_match(args, i, (total_wins, total_draws, i)))
+
+    # summarize in match order, so the summary doesn't depend on --jobs
+    results.sort(key=lambda result: result["index"])
+    draw_reasons = {}
+    total_move_count = 0
+    cutoffs = 0
+    first_move_cutoffs = 0
+    accuracy = {}
+    eval_cache = {}
+    tt_probes = {}
+    calls = 0
+    pruning = {}
+    proof_number = {}
+    ponder = {}
+    for result in results:
+        if result["payoff"] == 0.0:
+            draw_reasons[result["reason"]] = draw_reasons.get(result["reason"], 0) + 1
+        total_move_count += result["move_count"]
+        cutoffs += result["cutoffs"]
+        first_move_cutoffs += result["first_move_cutoffs"]
+        for key, value in (result["accuracy"] or {}).items():
+            accuracy[key] = accuracy.get(key, 0) + value
+        for key, value in result["eval_cache"].items():
+            eval_cache[key] = eval_cache.get(key, 0) + value
+        for key, value in result["tt_probes"].items():
+            tt_probes[key] = tt_probes.get(key, 0) + value
+        calls += result["calls"]
+        for key, value in result["pruning"].items():
+            pruning[key] = pruning.get(key, 0) + value
+        for key, value in result["proof_number"].items():
+            proof_number[key] = proof_number.get(key, 0) + value
+        for key, value in result["ponder"].items():
+            ponder[key] = ponder.get(key, 0) + value
+
     average_move_count = total_move_count / args.matches
     total_elapsed = time.perf_counter() - t0_total
     avg_time = total_elapsed / args.matches
@@ -117,6 +380,59 @@ def main():
     print(f"Total time: {time_pretty(total_elapsed)}")
     print(f"Average time/game: {time_pretty(avg_time)}")
 
+    if calls:
+        print(f"Heuristic calls: {calls}")
+
+    if pruning:
+        print(f"Pruning: {pruning['reductions']} late-move reductions ({pruning['researches']} re-searched), "
+              f"{pruning['futility_prunes']} futility prunes")
+
+    if proof_number:
+        print(f"Proof-number solver: {proof_number['proofs']} of {proof_number['solves']} searches proved mate, "
+              f"{proof_number['nodes']} nodes")
+
+    if ponder:
+        print(f"Ponder hits: {ponder['hits']} of {ponder['ponders']} ponders "
+              f"({ponder['hits'] / ponder['ponders'] * 100 if ponder['ponders'] else 0.0:.1f}%)")
+
+    if cutoffs:
+        print(f"First-move cutoff rate: {first_move_cutoffs / cutoffs * 100:.2f}% of {cutoffs} cutoffs")
+
+    if tt_probes:
+        probes = tt_probes["hits"] + tt_probes["misses"]
+        print(f"Transposition table: {tt_probes['hits'] / probes * 100 if probes else 0.0:.2f}% hits of {probes} probes")
+
+    if eval_cache:
+        lookups = eval_cache["hits"] + eval_cache["misses"]
+        print(f"Eval cache: {eval_cache['hits'] / lookups * 100 if lookups else 0.0:.2f}% hits of {lookups} lookups, "
+              f"{eval_cache['evictions']} evictions")
+
+    if args.stats:
+        search_stats = [record for result in results for record in result["search_stats"]]
+        print("Search stats: " + format_summary(summarize(search_stats)))
+        searching = lambda result: summarize(result["search_stats"])["time"]
+        slowest = max(results, key=searching)
+        print(f"slowest game: match {slowest['index'] + 1}, {searching(slowest):.2f}s searching")
+
+    if args.profile:
+        profile = {}
+        for result in results:
+            for stack, count in result["profile"].items():
+                profile[stack] = profile.get(stack, 0) + count
+        write_collapsed(profile, os.path.join(args.profile, "all.collapsed"))
+        table = format_hot_functions(profile)
+        with open(os.path.join(args.profile, "hot_functions.txt"), "w") as f:
+            f.write(table + "\n")
+        print("Hot functions (share of samples):")
+        print(table)
+
+    if args.dtm_loss:
+        scored = accuracy.get("moves", 0)
+        avg_loss = accuracy.get("dtm_moves_lost", 0) / scored if scored else 0.0
+        optimal = accuracy.get("optimal", 0) / scored * 100 if scored else 0.0
+        print(f"DTM loss: {avg_loss:.3f} moves per White move over {scored} moves "
+              f"({optimal:.1f}% optimal), wins thrown away: {accuracy.get('wins_thrown', 0)}")
+
 
 if __name__ == "__main__":
     main()
@@ -1,5 +1,6 @@
 import itertools as it
 import chess
+from kbnk import BB, KING_ATTACKS, KNIGHT_ATTACKS, KBNKState, bishop_attacks
 
 def square_color(sq):
     file = chess.square_file(sq)
@@ -22,14 +23,12 @@ def edge_distance(b_king):
     rank = chess.square_rank(b_king)
     return min(file, 7 - file, rank, 7 - rank)
 
-def king_mobility(board, b_king):
-    mobility = 0
-
-    for move in board.legal_moves:
-        if move.from_square == b_king:
-            mobility += 1
-    
-    return mobility
+def king_mobility(w_king, b_king, w_bishop, w_knight):
+    # squares the black king can move to: its neighbours that no white piece
+    # attacks or defends (the king itself doesn't block the bishop)
+    occupied = BB[w_king] | BB[w_bishop] | BB[w_knight]
+    attacked = KING_ATTACKS[w_king] | KNIGHT_ATTACKS[w_knight] | bishop_attacks(w_bishop, occupied)
+    return chess.popcount(KING_ATTACKS[b_king] & ~attacked)
 
 def average_piece_distance(w_king, w_bishop, w_knight):
 
@@ -37,6 +36,16 @@ def average_piece_distance(w_king, w_bishop, w_knight):
     dists = [manhattan_distance(sq1, sq2) for sq1, sq2 in it.combinations([w_king, w_bishop, w_knight], 2)]
     return sum(dists) / len(dists)
 
+
+# lookup tables for evaluate, built from the functions above
+SQUARE_COLOR = [square_color(sq) for sq in chess.SQUARES]
+# CORNER_DISTANCE[bishop square colour][black king]
+CORNER_DISTANCE = [[distance_to_target_corner(sq, bishop) for sq in chess.SQUARES]
+                   for bishop in (chess.A1, chess.A8)]
+EDGE_DISTANCE = [edge_distance(sq) for sq in chess.SQUARES]
+MANHATTAN = [[manhattan_distance(a, b) for b in chess.SQUARES] for a in chess.SQUARES]
+CHEBYSHEV = [[chess.square_distance(a, b) for b in chess.SQUARES] for a in chess.SQUARES]
+
 # def draw_risk(board):
 #     for mv in board.legal_moves:
 #         if board.is_capture(mv):
@@ -50,8 +59,6 @@ def average_piece_distance(w_king, w_bishop, w_knight):
 
 
 def evaluate(pos):
-    board = pos.board
-
     if pos.is_terminal():
         p = pos.payoff()
         if p == 0.0:
@@ -65,8 +72,7 @@ def evaluate(pos):
     # if draw_risk(board):
     #     return -1000.0
 
-    key = board._transposition_key()
-    count = pos.history.get(key, 0)
+    count = pos.history.get(pos.key, 0)
 
     if count == 3:
         return -1000.0
@@ -74,32 +80,31 @@ def evaluate(pos):
         return -250.0
     
     
-    b_king = board.king(chess.BLACK)
-    w_king = board.king(chess.WHITE)
-    bishops = list(board.pieces(chess.BISHOP, chess.WHITE))
-    knights = list(board.pieces(chess.KNIGHT, chess.WHITE))   
-    w_bishop = bishops[0]
-    w_knight = knights[0]
+    w_king, b_king, w_bishop, w_knight = pos.squares()
     
     # HEURISTICS
 
     # max square distance is 7 (A1 to H8 or A8 to H1)
-    cornering_score = 1 - (distance_to_target_corner(b_king, w_bishop) / 7)
+    cornering_score = 1 - (CORNER_DISTANCE[SQUARE_COLOR[w_bishop]][b_king] / 7)
 
     # max edge distance is 3 (D4 to A4 or D4 to D1)
-    ed = edge_distance(b_king)
+    ed = EDGE_DISTANCE[b_king]
     edge_score = 1 - (ed / 3)  
 
     # max square distance between kings is also 7
-    kings_distance_score = 1 - (chess.square_distance(w_king, b_king) / 7)
+    kings_distance_score = 1 - (CHEBYSHEV[w_king][b_king] / 7)
 
-    # max king mobility is 8
-    restrictiveness_score = 1 - (king_mobility(board, b_king) / 8)
+    # max king mobility is 8; only counted with black to move, as when this
+    # counted black king moves in the legal move list
+    mobility = king_mobility(w_king, b_king, w_bishop, w_knight) if pos.actor() == 1 else 0
+    restrictiveness_score = 1 - (mobility / 8)
 
     # max average manhattan distance between pieces is 14
-    coordination_score = 1 - (average_piece_distance(w_king, w_bishop, w_knight) / 14)
+    row = MANHATTAN[w_king]
+    average_distance = (row[w_bishop] + row[w_knight] + MANHATTAN[w_bishop][w_knight]) / 3
+    coordination_score = 1 - (average_distance / 14)
 
-    urgency_penalty = board.halfmove_clock / 100.0
+    urgency_penalty = pos.halfmove_clock() / 100.0
     # repetition_penalty = 1.0 if board.is_repetition(2) else 0.0
 
     corner_weight = 0.35 if ed <= 1 else 0.25
@@ -113,4 +118,129 @@ def evaluate(pos):
         0.25 * kings_distance_score -
         .15 * urgency_penalty
         )
-    return score
\ No newline at end of file
+    return score
+
+
+# evaluate's placement terms, already weighted, for evaluate_incremental.  Each is
+# the exact float evaluate computes, so the incremental score is bit-identical.
+# BLACK_KING_TERM[bishop square colour][black king]: the corner and edge terms summed
+BLACK_KING_TERM = [[(0.35 if EDGE_DISTANCE[sq] <= 1 else 0.25) * (1 - (CORNER_DISTANCE[color][sq] / 7)) +
+                    (0.10 if EDGE_DISTANCE[sq] <= 1 else 0.15) * (1 - (EDGE_DISTANCE[sq] / 3))
+                    for sq in chess.SQUARES] for color in (0, 1)]
+KINGS_TERM = [[0.25 * (1 - (CHEBYSHEV[a][b] / 7)) for b in chess.SQUARES] for a in chess.SQUARES]
+# COORDINATION_TERM[sum of the white pieces' pairwise manhattan distances]
+COORDINATION_TERM = [0.10 * (1 - ((total / 3) / 14)) for total in range(43)]
+
+
+def coordination_term(w_king, w_bishop, w_knight):
+    row = MANHATTAN[w_king]
+    return COORDINATION_TERM[row[w_bishop] + row[w_knight] + MANHATTAN[w_bishop][w_knight]]
+
+
+class ScoredKBNKState(KBNKState):
+    ''' A KBNKState that carries evaluate's placement terms (black king, white
+        pieces' coordination, king distance) and, when a move is applied, updates
+        only the terms that depend on the piece that moved.
+
+        Set ScoredKBNKState.check_terms to True to compare every evaluate_incremental
+        score against a full evaluate.
+    '''
+    __slots__ = ("terms", "_term_undo")
+
+    check_terms = False
+
+    def __init__(self, wk, bk, wb, wn, white=True, clock=0, history=None):
+        super().__init__(wk, bk, wb, wn, white, clock, history)
+        self.terms = None
+        if not self.captured:
+            self.terms = (BLACK_KING_TERM[SQUARE_COLOR[wb]][bk], coordination_term(wk, wb, wn), KINGS_TERM[wk][bk])
+        self._term_undo = []
+
+    def apply(self, action):
+        self._term_undo.append(self.terms)
+        super().apply(action)
+        if self.captured:
+            # terminal, so never scored
+            self.terms = None
+            return
+
+        black_king, coordination, kings = self.terms
+        wk, bk = self.wk, self.bk
+        if self.white:
+            # black moved its king
+            black_king = BLACK_KING_TERM[SQUARE_COLOR[self.wb]][bk]
+            kings = KINGS_TERM[wk][bk]
+        else:
+            coordination = coordination_term(wk, self.wb, self.wn)
+            if action.to_square == wk:
+                kings = KINGS_TERM[wk][bk]
+        self.terms = (black_king, coordination, kings)
+
+    def undo(self):
+        super().undo()
+        self.terms = self._term_undo.pop()
+
+
+def evaluate_incremental(pos):
+    ''' Returns evaluate(pos) for a ScoredKBNKState, reading the placement terms
+        the state carries instead of recomputing them.
+    '''
+    if pos.is_terminal():
+        p = pos.payoff()
+        if p == 0.0:
+            return -1000.0
+        return p * 1000.0
+
+    count = pos.history.get(pos.key, 0)
+    if count == 3:
+        return -1000.0
+    if count == 2:
+        return -250.0
+
+    black_king, coordination, kings = pos.terms
+    mobility = king_mobility(pos.wk, pos.bk, pos.wb, pos.wn) if not pos.white else 0
+    score = (
+        black_king +
+        0.25 * (1 - (mobility / 8)) +
+        coordination +
+        kings -
+        .15 * (pos.clock / 100.0)
+        )
+
+    if pos.check_terms:
+        expected = evaluate(pos)
+        if score != expected:
+            raise AssertionError(f"incremental evaluation differs on {pos.to_board().fen()}: {score} != {expected}")
+    return score
+
+
+if __name__ == "__main__":
+    # micro-benchmark: leaf evaluations per second over positions from random games
+    import random
+    import time
+    from chess_bnk import ChessBNKGame
+
+    leaves = []
+    for seed in range(40):
+        pos = ChessBNKGame(seed).initial_state()
+        rng = random.Random(seed)
+        for _ in range(30):
+            if pos.is_terminal():
+                break
+            pos = pos.successor(rng.choice(pos.get_actions()))
+            leaves.append(pos)
+
+    def bench(f, positions):
+        n = 0
+        t0 = time.perf_counter()
+        while time.perf_counter() - t0 < 2.0:
+            for pos in positions:
+                f(pos)
+            n += len(positions)
+        return n / (time.perf_counter() - t0)
+
+    print(f"evaluate: {bench(evaluate, leaves):.0f} leaf evaluations/s over {len(leaves)} positions")
+    native = [KBNKState.from_state(pos) for pos in leaves]
+    print(f"evaluate (KBNKState): {bench(evaluate, native):.0f} leaf evaluations/s")
+    scored = [ScoredKBNKState.from_state(pos) for pos in leaves]
+    print(f"evaluate_incremental: {bench(evaluate_incremental, scored):.0f} leaf evaluations/s")
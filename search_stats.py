@@ -0,0 +1,228 @@
+import threading
+import time
+
+from chess_bnk import ChessBNKState
+
+
+class SearchStats:
+    ''' Counters and timings for the searches of one policy, recorded per move.
+
+        The searches (minimax, alphabeta, pvs with a stats argument) count nodes,
+        leaf evaluations, terminal positions, repetitions and cutoffs by the index
+        of the refuting move.  The time spent generating moves, playing and taking
+        back moves, and evaluating is measured around the state and heuristic
+        (see instrument and timed), so the search code itself only counts.  Only the
+        thread that began the move is timed, so a search pondering in the background
+        (which the policy runs without stats) adds nothing.
+    '''
+    def __init__(self):
+        # one dict per move, as returned by end_move
+        self.moves = []
+        self.begin_move()
+
+
+    def begin_move(self):
+        ''' Resets the counters for the next move's search.
+        '''
+        self.nodes = 0
+        self.leaf_evals = 0
+        self.terminals = 0
+        self.repetitions = 0
+        self.depth = 0
+        # cutoffs[i] counts cutoffs by the i-th move searched at a node
+        self.cutoffs = []
+        self.movegen_time = 0.0
+        self.successor_time = 0.0
+        self.eval_time = 0.0
+        self.thread = threading.get_ident()
+        self.start = time.perf_counter()
+
+
+    def end_move(self, ponder_hit=False):
+        ''' Records the counters of the move's search and returns them.
+
+            ponder_hit -- whether the move came from a search done while pondering,
+                          which this record doesn't count
+        '''
+        record = {
+            "search": len(self.moves) + 1,
+            "nodes": self.nodes,
+            "leaf_evals": self.leaf_evals,
+            "terminals": self.terminals,
+            "repetitions": self.repetitions,
+            "depth": self.depth,
+            "cutoffs": list(self.cutoffs),
+            "ebf": self.nodes ** (1 / self.depth) if self.depth and self.nodes else 0.0,
+            "time": time.perf_counter() - self.start,
+            "movegen_time": self.movegen_time,
+            "successor_time": self.successor_time,
+            "eval_time": self.eval_time,
+            "ponder_hit": ponder_hit,
+        }
+        self.moves.append(record)
+        return record
+
+
+    def count_node(self, pos, depth, count):
+        ''' Counts a node the search has entered, as a terminal, leaf or repeated
+            position if it is one (in the order the search tests them).
+
+            pos -- the position
+            depth -- remaining depth at pos
+            count -- how many times pos has occurred in the game and search
+        '''
+        self.nodes += 1
+        if depth > self.depth:
+            self.depth = depth
+        if pos.is_terminal():
+            self.terminals += 1
+        elif depth == 0:
+            self.leaf_evals += 1
+        elif count >= 2:
+            self.repetitions += 1
+
+
+    def count_batch(self, moves):
+        ''' Counts the children of a node scored in one batch as leaves.
+        '''
+        self.nodes += len(moves)
+        self.leaf_evals += len(moves)
+
+
+    def cutoff(self, index):
+        ''' Counts a cutoff by the index-th move searched at a node.
+        '''
+        while len(self.cutoffs) <= index:
+            self.cutoffs.append(0)
+        self.cutoffs[index] += 1
+
+
+    def timed(self, fxn):
+        ''' Returns fxn (a heuristic or batch scorer) adding the time it takes to
+            eval_time, less any move generation or apply/undo it does itself.
+        '''
+        def timed_fxn(*args):
+            if threading.get_ident() != self.thread:
+                return fxn(*args)
+            t0 = time.perf_counter()
+            inner = self.movegen_time + self.successor_time
+            try:
+                return fxn(*args)
+            finally:
+                nested = self.movegen_time + self.successor_time - inner
+                self.eval_time += time.perf_counter() - t0 - nested
+        return timed_fxn
+
+
+    def instrument(self, state):
+        ''' Returns a subclass of the state class state whose move generation adds to
+            movegen_time, and whose apply and undo add to successor_time.
+        '''
+        stats = self
+
+        class Instrumented(state):
+            __slots__ = ()
+
+            def get_actions(self):
+                if threading.get_ident() != stats.thread:
+                    return super().get_actions()
+                t0 = time.perf_counter()
+                moves = super().get_actions()
+                stats.movegen_time += time.perf_counter() - t0
+                return moves
+
+            def apply(self, action):
+                if threading.get_ident() != stats.thread:
+                    return super().apply(action)
+                t0 = time.perf_counter()
+                super().apply(action)
+                stats.successor_time += time.perf_counter() - t0
+
+            def undo(self):
+                if threading.get_ident() != stats.thread:
+                    return super().undo()
+                t0 = time.perf_counter()
+                super().undo()
+                stats.successor_time += time.perf_counter() - t0
+        return Instrumented
+
+
+def summarize(records):
+    ''' Returns the totals of a list of per-move records: counters summed, cutoffs
+        summed by index, the mean effective branching factor, and the record of the
+        slowest search.  Moves answered by a ponder hit searched nothing themselves;
+        they count only in ponder_hits, and the time spent waiting for the pondering
+        search to finish in ponder_wait.
+    '''
+    pondered = [record for record in records if record["ponder_hit"]]
+    records = [record for record in records if not record["ponder_hit"]]
+    total = {"moves": len(records)}
+    for key in ("nodes", "leaf_evals", "terminals", "repetitions", "time",
+                "movegen_time", "successor_time", "eval_time"):
+        total[key] = sum(record[key] for record in records)
+    total["ponder_hits"] = len(pondered)
+    total["ponder_wait"] = sum(record["time"] for record in pondered)
+    cutoffs = []
+    for record in records:
+        for i, count in enumerate(record["cutoffs"]):
+            if i == len(cutoffs):
+                cutoffs.append(0)
+            cutoffs[i] += count
+    total["cutoffs"] = cutoffs
+    searched = [record["ebf"] for record in records if record["ebf"]]
+    total["ebf"] = sum(searched) / len(searched) if searched else 0.0
+    if records:
+        total["slowest"] = max(records, key=lambda record: record["time"])
+    return total
+
+
+def format_summary(total):
+    ''' Returns a one-paragraph description of a summarize result.
+    '''
+    cutoffs = total["cutoffs"]
+    n = sum(cutoffs)
+    by_index = ", ".join(f"{count / n * 100:.1f}%" for count in cutoffs[:3]) if n else "none"
+    t = total["time"] or 1.0
+    pondered = (f", {total['ponder_hits']} moves answered by pondering after {total['ponder_wait']:.2f}s waiting"
+                if total["ponder_hits"] else "")
+    lines = [
+        f"{total['moves']} searches{pondered}, {total['nodes']} nodes, {total['leaf_evals']} leaf evals, "
+        f"{total['terminals']} terminal and {total['repetitions']} repetition hits, mean EBF {total['ebf']:.2f}",
+        f"cutoffs: {n}, by the first three moves {by_index}",
+        f"time: {total['time']:.2f}s, move generation {total['movegen_time'] / t * 100:.1f}%, "
+        f"apply/undo {total['successor_time'] / t * 100:.1f}%, evaluation {total['eval_time'] / t * 100:.1f}%",
+    ]
+    if "slowest" in total:
+        record = total["slowest"]
+        where = f"match {record['match']}, " if "match" in record else ""
+        lines.append(f"slowest search: {where}#{record['search']}, {record['time']:.2f}s, {record['nodes']} nodes, "
+                     f"depth {record['depth']}, EBF {record['ebf']:.2f}")
+    return "\n".join(lines)
+
+
+def stats_policy(policy, stats, state=None):
+    ''' Wraps a policy so that each move's search is recorded in stats, on an
+        instrumented state: stats.instrument(state) converted with from_state, or,
+        if state is None, an instrumented ChessBNKState sharing the board and
+        history of the position given.  Moves the policy answered from a ponder hit
+        (see alphabeta.Ponder) are marked ponder_hit in their records.
+    '''
+    instrumented = stats.instrument(state if state is not None else ChessBNKState)
+    if state is not None:
+        convert = instrumented.from_state
+    else:
+        convert = lambda pos: instrumented(pos.board, pos.history, pos.key)
+
+    ponder = getattr(policy, "ponder_search", None)
+
+    def fxn(pos):
+        hits = ponder.hits if ponder is not None else 0
+        stats.begin_move()
+        move = policy(convert(pos))
+        stats.end_move(ponder is not None and ponder.hits > hits)
+        return move
+    fxn.__dict__.update(policy.__dict__)
+    if hasattr(policy, "ponder"):
+        fxn.ponder = lambda pos: policy.ponder(convert(pos))
+    fxn.stats = stats
+    return fxn
@@ -0,0 +1,205 @@
+"""
+Index of every valid KBNK starting position, and fixed benchmark suites.
+
+    python start_positions.py [--out kbnk_starts.npy] [--suites]
+
+A starting position is one ChessBNKGame may start from: white king, black king,
+white bishop and white knight on distinct squares, kings not adjacent, White to
+move, Black not in check and White not stalemated.  Positions are indexed as in
+tablebase.py, ((wk * 64 + bk) * 64 + wb) * 64 + wn, and the file stores one bit
+per index (2 MB).  Loading unpacks it into a sorted array of the valid indices,
+so drawing a position is one random index into that array.
+
+Suites are fixed lists of starting positions, one FEN per line in suites/, so
+every engine is measured on the same positions:
+    hardest200 -- the 200 longest mates with best play (one per symmetry class)
+    random200  -- 200 positions drawn uniformly with seed 0
+--suites rewrites them (hardest200 needs the tablebase).
+"""
+
+import argparse
+import os
+import random
+import time
+
+import chess
+import numpy as np
+
+from symmetry import REGION_INDEX, SYMMETRIES, TO_REGION, canonicalize
+from tablebase import KING_ADJ, KNIGHT_STEPS, N, in_check, split
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATH = os.path.join(DIR, "kbnk_starts.npy")
+SUITE_DIR = os.path.join(DIR, "suites")
+SUITE_SIZE = 200
+
+# square colour of the bishop, as scoring.square_color gives it
+DARK = 0
+LIGHT = 1
+
+
+def generate():
+    ''' Returns the sorted int64 array of every valid starting position index.
+    '''
+    parts = []
+    for wk in range(64):
+        idx = np.arange(wk << 18, (wk + 1) << 18, dtype=np.int64)
+        _, bk, wb, wn = split(idx)
+        wk_arr = np.full(len(idx), wk, dtype=np.int64)
+        distinct = (bk != wk) & (wb != wk) & (wn != wk) & (wb != bk) & (wn != bk) & (wb != wn)
+        valid = distinct & ~KING_ADJ[wk, bk] & ~in_check(wk_arr, bk, wb, wn)
+
+        # a knight with a free square always has a move; the few others are
+        # checked for stalemate with python-chess
+        free = np.zeros(len(idx), dtype=bool)
+        for k in range(8):
+            to = KNIGHT_STEPS[wn, k]
+            free |= (to >= 0) & (to != wk) & (to != wb)
+        for i in np.flatnonzero(valid & ~free):
+            if to_board(*(int(sq) for sq in split(idx[i]))).is_stalemate():
+                valid[i] = False
+        parts.append(idx[valid])
+    return np.concatenate(parts)
+
+
+def save(valid, path=DEFAULT_PATH):
+    bits = np.zeros(N, dtype=bool)
+    bits[valid] = True
+    np.save(path, np.packbits(bits))
+
+
+def load(path=DEFAULT_PATH):
+    ''' Returns the uint32 array of valid starting position indices stored at path,
+        or generates them if there is no file.
+    '''
+    if not os.path.exists(path):
+        return generate().astype(np.uint32)
+    return np.flatnonzero(np.unpackbits(np.load(path))).astype(np.uint32)
+
+
+def to_board(wk, bk, wb, wn):
+    ''' Returns the starting board, White to move, for the given squares.
+    '''
+    board = chess.Board(None)
+    board.set_piece_at(wk, chess.Piece(chess.KING, chess.WHITE))
+    board.set_piece_at(bk, chess.Piece(chess.KING, chess.BLACK))
+    board.set_piece_at(wb, chess.Piece(chess.BISHOP, chess.WHITE))
+    board.set_piece_at(wn, chess.Piece(chess.KNIGHT, chess.WHITE))
+    board.turn = chess.WHITE
+    return board
+
+
+def white_dtm(tb, idx):
+    ''' Returns the tablebase byte (0 draw, n mate in n - 1 plies) of every
+        White-to-move position in the index array idx.
+    '''
+    wk, bk, wb, wn = split(idx)
+    t = np.array(SYMMETRIES)
+    s = np.array(TO_REGION)[wk]
+    return tb.table[0][np.array(REGION_INDEX)[t[s, wk]], t[s, bk], t[s, wb], t[s, wn]]
+
+
+class StartIndex:
+    ''' The valid starting positions, optionally only those with the bishop on
+        one square colour or with a forced mate of a given length.
+    '''
+    def __init__(self, path=DEFAULT_PATH, bishop_colour=None, dtm=None, tb=None):
+        ''' path -- file written by save (generated in memory if missing)
+            bishop_colour -- DARK or LIGHT, or None for both
+            dtm -- (shortest, longest) mate in plies with best play to keep, or None
+            tb -- a tablebase.Tablebase, needed for dtm
+        '''
+        idx = load(path)
+        if bishop_colour is not None:
+            wb = (idx >> 6) & 63
+            idx = idx[(wb % 8 + wb // 8) % 2 == bishop_colour]
+        if dtm is not None:
+            plies = white_dtm(tb, idx).astype(np.int64) - 1
+            idx = idx[(plies >= dtm[0]) & (plies <= dtm[1])]
+        self.idx = idx
+
+
+    def __len__(self):
+        return len(self.idx)
+
+
+    def squares(self, i):
+        ''' Returns (wk, bk, wb, wn) of the i-th position.
+        '''
+        return tuple(int(sq) for sq in split(self.idx[i]))
+
+
+    def sample(self, rng):
+        ''' Returns the squares of a position drawn uniformly with rng, a random.Random.
+        '''
+        return self.squares(rng.randrange(len(self.idx)))
+
+
+def build_suite(name, tb=None):
+    ''' Returns the boards of a suite, computed from the index (see the module notes).
+    '''
+    if name == "random200":
+        index = StartIndex()
+        rng = random.Random(0)
+        return [to_board(*index.sample(rng)) for _ in range(SUITE_SIZE)]
+
+    if name == "hardest200":
+        idx = load()
+        plies = white_dtm(tb, idx)
+        boards = []
+        seen = set()
+        # longest mates first, then by index; skip symmetric images
+        for i in np.lexsort((idx, -plies.astype(np.int64))):
+            squares = tuple(int(sq) for sq in split(idx[i]))
+            _, canonical = canonicalize(*squares)
+            if canonical in seen:
+                continue
+            seen.add(canonical)
+            boards.append(to_board(*squares))
+            if len(boards) == SUITE_SIZE:
+                break
+        return boards
+
+    raise ValueError(f"Unknown suite: {name}. Please select from: hardest200, random200")
+
+
+def suite_path(name):
+    return os.path.join(SUITE_DIR, name + ".fen")
+
+
+def load_suite(name):
+    ''' Returns the boards of a suite saved in suites/.
+    '''
+    with open(suite_path(name)) as f:
+        return [chess.Board(line.strip()) for line in f if line.strip()]
+
+
+def save_suite(name, boards):
+    os.makedirs(SUITE_DIR, exist_ok=True)
+    with open(suite_path(name), "w") as f:
+        for board in boards:
+            f.write(board.fen() + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the KBNK starting position index and benchmark suites.")
+    parser.add_argument("--out", type=str, default=DEFAULT_PATH)
+    parser.add_argument("--suites", action="store_true", help="Also rewrite the suites in suites/ (needs the tablebase)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    valid = generate()
+    save(valid, args.out)
+    print(f"Wrote {args.out}: {len(valid)} valid starting positions "
+          f"({os.path.getsize(args.out) / 2 ** 20:.1f} MB) in {time.perf_counter() - t0:.1f}s")
+
+    if args.suites:
+        import tablebase
+        tb = tablebase.Tablebase()
+        for name in ("hardest200", "random200"):
+            save_suite(name, build_suite(name, tb))
+            print(f"Wrote {suite_path(name)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import chess
+from kbnk import BK_KEYS, MOVES, WB_KEYS, WK_KEYS, WN_KEYS
+from transposition import ZOBRIST_CLOCK, ZOBRIST_TURN
+
+# Board symmetries that keep every square's colour: identity, the 180 degree
+# rotation, and reflection in the a1-h8 and a8-h1 diagonals.  With no pawns and
+# no castling they map KBNK positions to positions of the same value.
+
+
+def _transform(f):
+    return [chess.square(*f(chess.square_file(sq), chess.square_rank(sq))) for sq in chess.SQUARES]
+
+
+SYMMETRIES = [
+    _transform(lambda file, rank: (file, rank)),
+    _transform(lambda file, rank: (7 - file, 7 - rank)),
+    _transform(lambda file, rank: (rank, file)),
+    _transform(lambda file, rank: (7 - rank, 7 - file)),
+]
+
+# every square maps into this region (file <= rank, file + rank <= 7) under one
+# of the symmetries
+REGION = [sq for sq in chess.SQUARES
+          if chess.square_file(sq) <= chess.square_rank(sq)
+          and chess.square_file(sq) + chess.square_rank(sq) <= 7]
+REGION_INDEX = [REGION.index(sq) if sq in REGION else -1 for sq in chess.SQUARES]
+
+# for each square, the first symmetry that maps it into REGION
+TO_REGION = [next(i for i, t in enumerate(SYMMETRIES) if REGION_INDEX[t[sq]] >= 0)
+             for sq in chess.SQUARES]
+
+
+def canonicalize(wk, bk, wb, wn):
+    ''' Returns (symmetry, squares): the index of the symmetry that maps the given
+        squares to their representative (the smallest of the four images), and the
+        representative.  Positions with a captured piece are their own representative.
+    '''
+    if wb is None or wn is None:
+        return 0, (wk, bk, wb, wn)
+    return min(((i, (t[wk], t[bk], t[wb], t[wn])) for i, t in enumerate(SYMMETRIES)),
+               key=lambda image: image[1])
+
+
+def transform_move(move, symmetry):
+    ''' Returns move mapped by the given symmetry.  Every symmetry is its own
+        inverse, so this also maps moves of a representative back.
+    '''
+    if move is None or symmetry == 0:
+        return move
+    t = SYMMETRIES[symmetry]
+    return MOVES[t[move.from_square]][t[move.to_square]]
+
+
+def canonical_key(pos):
+    ''' Returns (key, symmetry): the polyglot hash of the representative of pos and
+        the symmetry that maps pos to it.
+    '''
+    symmetry, (wk, bk, wb, wn) = canonicalize(*pos.squares())
+    key = WK_KEYS[wk] ^ BK_KEYS[bk]
+    if wb is not None:
+        key ^= WB_KEYS[wb]
+    if wn is not None:
+        key ^= WN_KEYS[wn]
+    if pos.actor() == 0:
+        key ^= ZOBRIST_TURN
+    return key, symmetry
+
+
+def canonical_position_key(pos):
+    ''' Returns (key, symmetry) as canonical_key does, with the key combined with the
+        halfmove clock as in transposition.position_key.
+    '''
+    key, symmetry = canonical_key(pos)
+    return key ^ ZOBRIST_CLOCK[pos.halfmove_clock() & 0xFF], symmetry
@@ -0,0 +1,362 @@
+"""
+KBNK distance-to-mate tablebase, built by retrograde analysis.
+
+    python tablebase.py [--out kbnk_dtm.npy]
+
+Every position (white king, black king, white bishop, white knight, side to move)
+is indexed as ((wk * 64 + bk) * 64 + wb) * 64 + wn, so both bishop colours are
+covered.  Working backwards from the mates, each pass finds the white-to-move
+positions with a move into a lost black position, then the black-to-move
+positions whose every move leads to a won white position.  All index arithmetic
+is done on NumPy arrays.
+
+The file stores one byte per position with the white king in symmetry.REGION
+(the colour-preserving symmetries map every position there):
+    0   -- draw (including stalemate and positions where black can take a piece)
+    255 -- illegal position
+    n   -- white mates in n - 1 plies
+It is memory-mapped on load.  The fifty-move rule and repetitions are ignored.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from kbnk import KBNKState
+from symmetry import REGION, REGION_INDEX, SYMMETRIES, TO_REGION
+
+N = 64 ** 4
+DRAW = 0
+ILLEGAL = 255
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kbnk_dtm.npy")
+
+# entries per chunk of frontier work, to bound memory
+CHUNK = 1 << 20
+
+FILES = np.arange(64) % 8
+RANKS = np.arange(64) // 8
+BIT = np.left_shift(np.uint64(1), np.arange(64, dtype=np.uint64))
+
+_df = np.abs(FILES[:, None] - FILES[None, :])
+_dr = np.abs(RANKS[:, None] - RANKS[None, :])
+KING_ADJ = np.maximum(_df, _dr) == 1
+KNIGHT_ADJ = ((_df == 1) & (_dr == 2)) | ((_df == 2) & (_dr == 1))
+SAME_DIAG = (_df == _dr) & (_df > 0)
+
+
+def _steps(deltas):
+    table = np.full((64, len(deltas)), -1, dtype=np.int64)
+    for sq in range(64):
+        for k, (df, dr) in enumerate(deltas):
+            f, r = FILES[sq] + df, RANKS[sq] + dr
+            if 0 <= f < 8 and 0 <= r < 8:
+                table[sq, k] = r * 8 + f
+    return table
+
+
+KING_STEPS = _steps([(df, dr) for df in (-1, 0, 1) for dr in (-1, 0, 1) if df or dr])
+KNIGHT_STEPS = _steps([(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)])
+# RAYS[sq, direction, distance - 1]
+RAYS = np.stack([_steps([(d * df, d * dr) for d in range(1, 8)])
+                 for df, dr in ((1, 1), (1, -1), (-1, -1), (-1, 1))], axis=1)
+
+# squares strictly between two squares on a diagonal
+BETWEEN = np.zeros((64, 64), dtype=np.uint64)
+for _sq in range(64):
+    for _direction in range(4):
+        _mask = np.uint64(0)
+        for _to in RAYS[_sq, _direction]:
+            if _to < 0:
+                break
+            BETWEEN[_sq, _to] = _mask
+            _mask |= BIT[_to]
+
+
+def split(idx):
+    ''' Returns the (wk, bk, wb, wn) square arrays of an index array.
+    '''
+    return idx >> 18, (idx >> 12) & 63, (idx >> 6) & 63, idx & 63
+
+
+def join(wk, bk, wb, wn):
+    return (((wk << 6) | bk) << 6 | wb) << 6 | wn
+
+
+def bishop_sees(wb, sq, wk, wn):
+    ''' Returns where a bishop on wb attacks sq, with the white king and knight as
+        the only possible blockers (the black king never blocks its own square).
+    '''
+    return SAME_DIAG[wb, sq] & ((BETWEEN[wb, sq] & (BIT[wk] | BIT[wn])) == 0)
+
+
+def in_check(wk, bk, wb, wn):
+    return KNIGHT_ADJ[wn, bk] | bishop_sees(wb, bk, wk, wn)
+
+
+def black_moves(wk, bk, wb, wn):
+    ''' Returns the number of legal black king moves, captures included.
+    '''
+    count = np.zeros(len(wk), dtype=np.int8)
+    for k in range(8):
+        to = KING_STEPS[bk, k]
+        ok = to >= 0
+        to = np.where(ok, to, 0)
+        took_bishop = to == wb
+        took_knight = to == wn
+        attacked = (KING_ADJ[wk, to] | (to == wk)
+                    | (KNIGHT_ADJ[wn, to] & ~took_knight)
+                    | (bishop_sees(wb, to, wk, wn) & ~took_bishop))
+        count += ok & ~attacked
+    return count
+
+
+def generate(verbose=True):
+    ''' Computes the tablebase and returns (white_to_move, black_to_move) arrays of
+        N bytes each, in the encoding described at the top of this module.
+    '''
+    t0 = time.perf_counter()
+    white = np.zeros(N, dtype=np.uint8)
+    black = np.zeros(N, dtype=np.uint8)
+    moves_left = np.zeros(N, dtype=np.int8)
+    mates = []
+
+    # legality, checks and black move counts, one white king square at a time
+    for wk in range(64):
+        idx = np.arange(wk << 18, (wk + 1) << 18, dtype=np.int64)
+        _, bk, wb, wn = split(idx)
+        wk_arr = np.full(len(idx), wk, dtype=np.int64)
+        distinct = (bk != wk) & (wb != wk) & (wn != wk) & (wb != bk) & (wn != bk) & (wb != wn)
+        legal = distinct & ~KING_ADJ[wk, bk]
+        check = in_check(wk_arr, bk, wb, wn)
+        count = black_moves(wk_arr, bk, wb, wn)
+
+        block = slice(wk << 18, (wk + 1) << 18)
+        white[block] = np.where(legal & ~check, DRAW, ILLEGAL)
+        black[block] = np.where(legal, DRAW, ILLEGAL)
+        moves_left[block] = count
+        mates.append(idx[legal & check & (count == 0)])
+
+    lost = np.concatenate(mates)
+    black[lost] = 1
+    if verbose:
+        print(f"setup {time.perf_counter() - t0:.1f}s, {len(lost)} mates")
+
+    plies = 0
+    while len(lost):
+        won = np.unique(np.concatenate([_white_unmoves(lost[i:i + CHUNK], white)
+                                        for i in range(0, len(lost), CHUNK)]))
+        white[won] = plies + 2
+
+        lost = np.concatenate([_black_unmoves(won[i:i + CHUNK], black, moves_left)
+                               for i in range(0, len(won), CHUNK)] + [won[:0]])
+        black[lost] = plies + 3
+        plies += 2
+        if verbose and len(won):
+            print(f"white mates in {plies - 1} plies: {len(won)} positions, "
+                  f"black mated in {plies}: {len(lost)} ({time.perf_counter() - t0:.1f}s)")
+
+    return white, black
+
+
+def _white_unmoves(lost, white):
+    # white-to-move positions, not yet won, with a move into a lost position
+    wk, bk, wb, wn = split(lost)
+    found = []
+
+    def keep(pred, ok):
+        pred = pred[ok]
+        found.append(pred[white[pred] == DRAW])
+
+    for k in range(8):
+        frm = KING_STEPS[wk, k]
+        ok = frm >= 0
+        frm = np.where(ok, frm, 0)
+        ok &= (frm != bk) & (frm != wb) & (frm != wn) & ~KING_ADJ[frm, bk]
+        ok &= ~in_check(frm, bk, wb, wn)
+        keep(join(frm, bk, wb, wn), ok)
+
+        frm = KNIGHT_STEPS[wn, k]
+        ok = frm >= 0
+        frm = np.where(ok, frm, 0)
+        ok &= (frm != wk) & (frm != bk) & (frm != wb)
+        ok &= ~in_check(wk, bk, wb, frm)
+        keep(join(wk, bk, wb, frm), ok)
+
+    for direction in range(4):
+        blocked = np.zeros(len(lost), dtype=bool)
+        for d in range(7):
+            frm = RAYS[wb, direction, d]
+            off = frm < 0
+            frm = np.where(off, 0, frm)
+            blocked |= off | (frm == wk) | (frm == bk) | (frm == wn)
+            ok = ~blocked & ~in_check(wk, bk, frm, wn)
+            keep(join(wk, bk, frm, wn), ok)
+
+    return np.concatenate(found)
+
+
+def _black_unmoves(won, black, moves_left):
+    # black-to-move positions whose last escape was just shown to lose
+    wk, bk, wb, wn = split(won)
+    preds = []
+    for k in range(8):
+        frm = KING_STEPS[bk, k]
+        ok = frm >= 0
+        frm = np.where(ok, frm, 0)
+        ok &= (frm != wk) & (frm != wb) & (frm != wn)
+        pred = join(wk, frm, wb, wn)[ok]
+        preds.append(pred[black[pred] == DRAW])
+
+    pred = np.concatenate(preds)
+    touched, hits = np.unique(pred, return_counts=True)
+    moves_left[touched] -= hits.astype(np.int8)
+    return touched[moves_left[touched] == 0]
+
+
+def reduce(white, black):
+    ''' Returns the stored (2, len(REGION), 64, 64, 64) array: white to move, then
+        black to move, for white king squares in the symmetry region.
+    '''
+    region = np.array(REGION)
+    return np.stack([side.reshape(64, 64, 64, 64)[region] for side in (white, black)])
+
+
+def save(white, black, path=DEFAULT_PATH):
+    np.save(path, reduce(white, black))
+
+
+class Tablebase:
+    ''' A memory-mapped KBNK distance-to-mate table.
+    '''
+    def __init__(self, path=DEFAULT_PATH):
+        ''' Maps the table file at path (see generate/save).
+        '''
+        self.table = np.load(path, mmap_mode="r")
+
+
+    def entry(self, wk, bk, wb, wn, white_to_move):
+        ''' Returns the stored byte for a position: 0 draw, 255 illegal, n white mates in n - 1 plies.
+        '''
+        t = SYMMETRIES[TO_REGION[wk]]
+        return int(self.table[0 if white_to_move else 1,
+                              REGION_INDEX[t[wk]], t[bk], t[wb], t[wn]])
+
+
+    def dtm(self, pos):
+        ''' Returns the number of plies to mate with best play for a state with
+            squares() and actor(), or None if the position is drawn (or not KBNK).
+        '''
+        wk, bk, wb, wn = pos.squares()
+        if wb is None or wn is None:
+            return None
+        e = self.entry(wk, bk, wb, wn, pos.actor() == 0)
+        if e == DRAW or e == ILLEGAL:
+            return None
+        return e - 1
+
+
+    def child_dtms(self, pos):
+        ''' Returns [(move, dtm)] for every legal move of pos, where dtm is that of the
+            resulting position (None if it is drawn, e.g. after a capture).
+        '''
+        wk, bk, wb, wn = pos.squares()
+        state = KBNKState(wk, bk, wb, wn, pos.actor() == 0)
+        result = []
+        for move in pos.get_actions():
+            state.apply(move)
+            result.append((move, self.dtm(state)))
+            state.undo()
+        return result
+
+
+def tablebase_policy(tb):
+    ''' Returns a White policy that plays the fastest mate, or, in a drawn position,
+        the first legal move.
+    '''
+    def fxn(pos):
+        best_move = None
+        best_dtm = None
+        for move, dtm in tb.child_dtms(pos):
+            if dtm is not None and (best_dtm is None or dtm < best_dtm):
+                best_move, best_dtm = move, dtm
+        if best_move is None:
+            moves = pos.get_actions()
+            return moves[0] if moves else None
+        return best_move
+    return fxn
+
+
+def tablebase_defender_policy(tb):
+    ''' Returns a Black policy that reaches a draw when it can (usually by taking a
+        piece) and otherwise delays mate as long as possible.
+    '''
+    def fxn(pos):
+        best_move = None
+        best_value = -1
+        for move, dtm in tb.child_dtms(pos):
+            value = float("inf") if dtm is None else dtm
+            if value > best_value:
+                best_move, best_value = move, value
+        return best_move
+    return fxn
+
+
+class DTMAccuracy:
+    ''' Scores White's moves against the tablebase.  For every move from a won
+        position it records how many moves of distance to mate were lost compared
+        with the best move, and counts moves that gave the win away.
+    '''
+    def __init__(self, tb):
+        self.tb = tb
+        self.moves = 0
+        self.plies_lost = 0
+        self.optimal = 0
+        self.wins_thrown = 0
+
+
+    def record(self, pos, move):
+        ''' Scores White playing move in pos.  Positions that are already drawn are skipped.
+        '''
+        children = self.tb.child_dtms(pos)
+        wins = [dtm for _, dtm in children if dtm is not None]
+        if not wins:
+            return
+        chosen = dict(children)[move]
+        if chosen is None:
+            self.wins_thrown += 1
+            return
+        self.moves += 1
+        lost = chosen - min(wins)
+        self.plies_lost += lost
+        if lost == 0:
+            self.optimal += 1
+
+
+    def stats(self):
+        ''' Returns a dict of the counters, with the DTM loss in moves (two plies).
+        '''
+        return {
+            "moves": self.moves,
+            "dtm_moves_lost": self.plies_lost / 2,
+            "optimal": self.optimal,
+            "wins_thrown": self.wins_thrown,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the KBNK distance-to-mate tablebase.")
+    parser.add_argument("--out", type=str, default=DEFAULT_PATH)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    white, black = generate()
+    save(white, black, args.out)
+    print(f"Longest mate: {int(white.max(where=white != ILLEGAL, initial=0)) - 1} plies")
+    print(f"Wrote {args.out} ({os.path.getsize(args.out) / 2 ** 20:.1f} MB) in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import random
+from array import array
+
+import chess
+import chess.polyglot
+
+# polyglot keys for the board and side to move, plus our own keys for the
+# halfmove clock (it changes the heuristic through the urgency penalty)
+ZOBRIST = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+ZOBRIST_TURN = ZOBRIST[780]
+_clock_rng = random.Random(0x5EED)
+ZOBRIST_CLOCK = [_clock_rng.getrandbits(64) for _ in range(256)]
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+NO_MOVE = 0xFFFF
+
+# bytes per slot: key (8) + value (8) + depth (1) + flag (1) + move (2)
+ENTRY_BYTES = 20
+
+
+def zobrist_hash(board):
+    ''' Returns the 64-bit polyglot hash of the given board.
+    '''
+    return chess.polyglot.zobrist_hash(board)
+
+
+def update_hash(key, board, move):
+    ''' Returns the hash of the board after move, given the hash of the board before it.
+        No pawns, castling or en passant in KBNK, so only the moving piece, a
+        possible capture and the side to move change.
+
+        key -- hash of board
+        board -- the board before move is pushed
+        move -- a legal move on board
+    '''
+    frm = move.from_square
+    to = move.to_square
+    kind = 2 * (board.piece_type_at(frm) - 1) + board.turn
+    key ^= ZOBRIST[64 * kind + frm] ^ ZOBRIST[64 * kind + to] ^ ZOBRIST_TURN
+
+    captured = board.piece_type_at(to)
+    if captured:
+        key ^= ZOBRIST[64 * (2 * (captured - 1) + (not board.turn)) + to]
+    return key
+
+
+def position_key(pos):
+    ''' Returns the search key of a position: its board hash combined with the
+        halfmove clock, since evaluate depends on both.
+    '''
+    return pos.key ^ ZOBRIST_CLOCK[pos.halfmove_clock() & 0xFF]
+
+
+def encode_move(move):
+    if move is None:
+        return NO_MOVE
+    return move.from_square * 64 + move.to_square
+
+
+def decode_move(code):
+    if code == NO_MOVE:
+        return None
+    return chess.Move(code >> 6, code & 63)
+
+
+class TranspositionTable:
+    ''' A fixed-size transposition table.  Each bucket holds two slots: a
+        depth-preferred slot that is only replaced by a search at least as deep,
+        and an always-replace slot that takes everything else.
+    '''
+    def __init__(self, size_mb=16, symmetric=False):
+        ''' Creates a table using at most size_mb megabytes of entry storage.
+
+            size_mb -- memory budget in megabytes
+            symmetric -- whether searches key it by symmetry.canonical_position_key, so
+                         that positions related by a board symmetry share an entry
+        '''
+        self.size_mb = size_mb
+        self.symmetric = symmetric
+        slots = max(2, int(size_mb * 2 ** 20) // ENTRY_BYTES)
+        buckets = 1
+        while buckets * 4 <= slots:
+            buckets *= 2
+        self.buckets = buckets
+        self.mask = buckets - 1
+        self.clear()
+
+
+    def clear(self):
+        ''' Empties the table and resets its counters.
+        '''
+        n = 2 * self.buckets
+        self.keys = array('Q', bytes(8 * n))
+        self.values = array('d', bytes(8 * n))
+        self.depths = array('b', [-1]) * n
+        self.flags = array('B', bytes(n))
+        self.moves = array('H', [NO_MOVE]) * n
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+        # bumped by the search whenever it scores a repeated position
+        self.rep_scores = 0
+
+
+    def probe(self, key):
+        ''' Returns (value, depth, flag, move) stored for key, or None.
+
+            key -- a position key (see position_key)
+        '''
+        i = 2 * (key & self.mask)
+        for slot in (i, i + 1):
+            if self.depths[slot] >= 0 and self.keys[slot] == key:
+                self.hits += 1
+                return (self.values[slot], self.depths[slot],
+                        self.flags[slot], decode_move(self.moves[slot]))
+
+        self.misses += 1
+        if self.depths[i] >= 0 or self.depths[i + 1] >= 0:
+            self.collisions += 1
+        return None
+
+
+    def store(self, key, value, depth, flag, move):
+        ''' Records a search result for key.
+
+            key -- a position key
+            value -- the value returned by the search
+            depth -- the remaining depth it was searched to
+            flag -- EXACT, LOWER (value is a lower bound) or UPPER (upper bound)
+            move -- best move found, or None
+        '''
+        i = 2 * (key & self.mask)
+        if self.depths[i] < 0 or self.keys[i] == key or depth >= self.depths[i]:
+            slot = i
+        else:
+            slot = i + 1
+        self.keys[slot] = key
+        self.values[slot] = value
+        self.depths[slot] = min(depth, 127)
+        self.flags[slot] = flag
+        self.moves[slot] = encode_move(move)
+        self.stores += 1
+
+
+    def store_move(self, key, value, flag, move):
+        ''' Records a search result for key whose value depends on the path to key
+            (a repetition was scored below it), so that only its move is kept.  An
+            entry already held for key takes the move and keeps its value and depth;
+            otherwise the result goes in at depth 0, which no probe can cut on, in the
+            always-replace slot unless the depth-preferred one is empty.
+
+            Arguments are store's.
+        '''
+        i = 2 * (key & self.mask)
+        for slot in (i, i + 1):
+            if self.depths[slot] >= 0 and self.keys[slot] == key:
+                self.moves[slot] = encode_move(move)
+                self.stores += 1
+                return
+        slot = i if self.depths[i] < 0 else i + 1
+        self.keys[slot] = key
+        self.values[slot] = value
+        self.depths[slot] = 0
+        self.flags[slot] = flag
+        self.moves[slot] = encode_move(move)
+        self.stores += 1
+
+
+    def stats(self):
+        ''' Returns a dict of the hit, miss, collision and store counters.
+        '''
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "collisions": self.collisions,
+            "stores": self.stores,
+            "rep_scores": self.rep_scores,
+        }